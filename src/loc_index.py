@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+
+# The tools live in the warhawk package (see cli.py for the warhawk command),
+# this keeps ./loc_index.py (and dragging files on to it) working
+from warhawk.loc_index import main
+
+if __name__ == '__main__':
+    main()
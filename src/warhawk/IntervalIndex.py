@@ -0,0 +1,75 @@
+import collections
+
+# A run of bytes covered by the same kinds of region. regions is the list of
+# (kind, owner) of every interval covering it, empty for unknown bytes.
+Segment = collections.namedtuple("Segment", ["start", "end", "regions"])
+
+class IntervalIndex:
+    '''Labelled [start, end) intervals of a file, eg. the regions a parser decoded.
+
+    Each interval has a kind (eg. "faces") and an owner (eg. the offset of the
+    model header), and the same range of the same kind is only kept once. The
+    questions (which bytes are covered, by what, and where intervals overlap)
+    are answered by a single sweep over the sorted interval ends, so the cost
+    depends on the number of intervals rather than the size of the file.
+    '''
+    def __init__(self):
+        self.__intervals = {}
+
+    def add(self, start: int, end: int, kind: str, owner=None):
+        if end > start:
+            self.__intervals.setdefault((start, end, kind), owner)
+
+    def __len__(self):
+        return len(self.__intervals)
+
+    def segments(self, size: int):
+        '''Split [0, size) into Segments wherever the set of intervals covering it changes'''
+        events = []
+        for (start, end, kind), owner in self.__intervals.items():
+            start, end = max(start, 0), min(end, size)
+            if end > start:
+                events.append((start, 1, kind, owner))
+                events.append((end, -1, kind, owner))
+        events.sort(key=lambda event: event[0])
+
+        segments = []
+        active = collections.Counter()
+        pos = 0
+        for offset, change, kind, owner in events:
+            if offset > pos:
+                segments.append(Segment(pos, offset, sorted(active.elements(), key=str)))
+                pos = offset
+            active[(kind, owner)] += change
+            if active[(kind, owner)] == 0:
+                del active[(kind, owner)]
+        if pos < size:
+            segments.append(Segment(pos, size, []))
+        return segments
+
+    def coverageMap(self, size: int):
+        '''Segments, with neighbours covered by the same kinds of region merged'''
+        merged = []
+        for segment in self.segments(size):
+            if merged and _kinds(merged[-1]) == _kinds(segment):
+                last = merged[-1]
+                regions = last.regions + [r for r in segment.regions if r not in last.regions]
+                merged[-1] = Segment(last.start, segment.end, regions)
+            else:
+                merged.append(segment)
+        return merged
+
+    def overlaps(self, size: int):
+        '''Segments covered by more than one interval, with neighbours covered by the same ones merged'''
+        merged = []
+        for segment in self.segments(size):
+            if len(segment.regions) < 2:
+                continue
+            if merged and merged[-1].end == segment.start and merged[-1].regions == segment.regions:
+                merged[-1] = Segment(merged[-1].start, segment.end, segment.regions)
+            else:
+                merged.append(segment)
+        return merged
+
+def _kinds(segment: Segment):
+    return sorted(set(kind for kind, owner in segment.regions))
@@ -0,0 +1,69 @@
+import os
+import mmap
+import struct
+
+from . import psarc
+
+def _map(filename: str):
+    if psarc.isArchivePath(filename):
+        return psarc.readFile(filename)
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b'' # Empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class NgpFile:
+    '''An .ngp and its .vram, each opened and memory-mapped only once.
+
+    An NgpFile is passed to every parser that needs the data, rather than each
+    of them rereading the files. The .vram is only opened when it's first used.
+
+    Parsers report the regions they decode with mark(). These are ignored
+    unless a recorder (eg. from ngp_coverage) is attached.
+
+    The stem can also be in a .psarc (archive.psarc:path/inside), in which case
+    the files are read from the archive and outputStem (where output files are
+    named after) is the path inside the archive.
+
+    Data that has already been read (eg. by the pipeline) can be passed as ngp
+    and vram, and is used instead of reading the files.
+    '''
+    filenameStem: str
+    outputStem: str
+    recorder = None
+
+    def __init__(self, filenameStem: str, ngp=None, vram=None):
+        self.filenameStem = filenameStem
+        self.outputStem = psarc.localPath(filenameStem)
+        self.ngp = ngp if ngp is not None else _map(filenameStem + ".ngp")
+        self.__vram = vram
+
+    @property
+    def vram(self):
+        if self.__vram is None:
+            self.__vram = _map(self.filenameStem + ".vram")
+        return self.__vram
+
+    def data(self, isInNGP: bool):
+        '''The .ngp data if isInNGP (ie. Data Location Flag is 0x01), otherwise the .vram data'''
+        return self.ngp if isInNGP else self.vram
+
+    def mark(self, isInNGP: bool, start: int, length: int, kind: str, owner=None):
+        '''Record that length bytes at start (in the .ngp if isInNGP, otherwise the .vram) were decoded as kind'''
+        if self.recorder is not None:
+            self.recorder(isInNGP, start, length, kind, owner)
+
+    def dereferenceRelativePointer(self, locOfPointer: int):
+        relativeOffset, = struct.unpack_from(">i", self.ngp, locOfPointer)
+        return locOfPointer + relativeOffset
+
+    def close(self):
+        for data in (self.ngp, self.__vram):
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
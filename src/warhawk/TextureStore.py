@@ -0,0 +1,45 @@
+import os
+import hashlib
+import threading
+
+from . import rtt2dds
+
+class TextureStore:
+    '''Content-addressed store for the .dds files of extracted textures.
+
+    Within a run, textures are remembered by (source file, texture header
+    offset), so a texture shared by many models is only extracted once. Across
+    runs (and .ngp files), each texture is stored once as <hash of the .rtt>.dds,
+    so textures that were seen before are not converted or written again.
+    '''
+    directory: str
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.__paths = {}
+        self.__lock = threading.Lock()
+
+    def get(self, filename: str, headerOffset: int, extract):
+        '''Path of the .dds for the texture at headerOffset in filename.
+
+        extract() is called to get the .rtt data if the texture isn't already known.
+        '''
+        key = (os.path.abspath(filename), headerOffset)
+        with self.__lock:
+            path = self.__paths.get(key)
+            if path is not None:
+                return path
+
+            rttdata = extract()
+            digest = hashlib.blake2b(rttdata, digest_size=16).hexdigest()
+            path = os.path.join(self.directory, digest + ".dds")
+            if not os.path.exists(path):
+                ddsdata = rtt2dds.rtt2dds(rttdata)
+                # Written under a temporary name, as other processes may be storing it too
+                tmp_path = "{}.{}.tmp".format(path, os.getpid())
+                with open(tmp_path, "wb") as f:
+                    f.write(ddsdata)
+                os.replace(tmp_path, path)
+            self.__paths[key] = path
+            return path
@@ -0,0 +1,19 @@
+import importlib
+
+__version__ = "0.1.0"
+
+# The modules are only imported when first used (import warhawk.rtt2dds, or
+# warhawk.rtt2dds after import warhawk), so importing the package stays quick.
+_MODULES = {
+    "DdsHeader", "IntervalIndex", "NgpFile", "TextureStore", "extract_loc", "ffutils", "find_ptr",
+    "follow_ptr", "instrument", "loc_index", "manifest", "ngp_coverage", "ngp_models", "ngp_textures",
+    "optional", "pipeline", "psarc", "ptrgraph", "rtt2dds", "rtt_inventory", "rtt_preview",
+}
+
+def __getattr__(name: str):
+    if name in _MODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | _MODULES)
@@ -0,0 +1,43 @@
+from . import manifest
+
+def pending(files: list, records: manifest.Manifest, sources, settings, quiet: bool=False):
+    """The (filepath, output) pairs of files whose outputs aren't up to date.
+
+    sources(filepath) lists the files an output is made from and settings(output)
+    what its manifest entry has to match. Without a Manifest every file is
+    pending. Unless quiet, says so when none are.
+    """
+    if records is None:
+        return files
+    remaining = [(filepath, output) for filepath, output in files
+                 if not records.isUpToDate(records.key(filepath), sources(filepath), settings(output))]
+    if not remaining and not quiet:
+        print("All {} files are up to date".format(len(files)))
+    return remaining
+
+def printSummary(done: str, total: int, num_bytes: int, elapsed: float, skipped: int=0):
+    """Print the outcome of a batch, done being the start of the line (eg. "Converted 12")."""
+    mib = num_bytes / (1024 * 1024)
+    print("{} of {} files ({:.1f} MiB in {:.2f}s, {:.1f} MiB/s)".format(
+        done, total, mib, elapsed, mib / elapsed if elapsed else 0.0))
+    if skipped:
+        print("Skipped {} up to date files".format(skipped))
+
+def printFailures(failures: list, byMessage: bool=False):
+    """Print the (filepath, error message) failures of a batch.
+
+    With byMessage, files that failed the same way are counted together,
+    which reads better when there are thousands of them.
+    """
+    if not failures:
+        return
+    print("Failed {} files:".format(len(failures)))
+    if not byMessage:
+        for filepath, err in failures:
+            print("    {}: {}".format(filepath, err))
+        return
+    counts = {}
+    for filepath, err in failures:
+        counts[err] = counts.get(err, 0) + 1
+    for msg, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print("    {} x {}".format(count, msg))
@@ -0,0 +1,39 @@
+import sys
+import argparse
+import importlib
+
+from . import __version__
+
+# Command: (module, what it does). A command's module is only imported when it
+# is run, so warhawk --help (or a single small conversion) doesn't pay for
+# importing every tool and their dependencies.
+COMMANDS = {
+    "rtt2dds": ("rtt2dds", "convert .rtt textures to .dds"),
+    "rtt-preview": ("rtt_preview", "decode .rtt textures to thumbnails or contact sheets"),
+    "rtt-inventory": ("rtt_inventory", "collect statistics on the headers of .rtt and .ngp textures"),
+    "ngp-models": ("ngp_models", "extract the models in .ngp files (.obj or .glb)"),
+    "ngp-textures": ("ngp_textures", "extract the textures in .ngp files (.rtt or .dds)"),
+    "ngp-coverage": ("ngp_coverage", "show which bytes of .ngp files are explained"),
+    "loc": ("extract_loc", "extract the strings in .loc files"),
+    "loc-index": ("loc_index", "build and query indexes of the strings in .loc files"),
+    "psarc": ("psarc", "list or extract the files in a .psarc"),
+    "pipeline": ("pipeline", "convert everything in a .psarc or directory in one go"),
+    "find-ptr": ("find_ptr", "find the pointers that lead to an address"),
+    "follow-ptr": ("follow_ptr", "follow the relative pointers from an address"),
+}
+
+def main(argv: list=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+            prog="warhawk", description="Convert and inspect the files of WarHawk",
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            epilog="commands:\n" + "".join("  {:<15}{}\n".format(name, description) for name, (module, description) in COMMANDS.items())
+                   + "\nRun warhawk <command> --help for the options of each command.")
+    parser.add_argument("--version", action="version", version="%(prog)s " + __version__)
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help="the tool to run (see below)")
+    # Only the command is parsed here, everything after it goes to the tool's own parser
+    args = parser.parse_args(argv[:1])
+
+    module = importlib.import_module("." + COMMANDS[args.command][0], __package__)
+    return module.main(argv[1:], parser.prog + " " + args.command)
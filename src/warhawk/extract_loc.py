@@ -0,0 +1,123 @@
+import os
+import json
+import argparse
+import struct
+import concurrent.futures
+
+from . import psarc
+from . import instrument
+
+def dereferenceRelativePointer(data, locOfPointer):
+    relativeOffset, = struct.unpack_from(">i", data, locOfPointer)
+    offset = locOfPointer + relativeOffset
+    return offset
+
+def readCStr(data, offset):
+    end = data.find(b'\x00', offset)
+    if end == -1:
+        raise ValueError("Unterminated string at " + hex(offset))
+    return data[offset:end].decode('latin-1')
+
+def readU16CStr(data, offset):
+    # The terminator has to be a whole (aligned) character, not the end of one and the start of the next
+    end = data.find(b'\x00\x00', offset)
+    while end != -1 and (end - offset) % 2 != 0:
+        end = data.find(b'\x00\x00', end + 1)
+    if end == -1:
+        raise ValueError("Unterminated string at " + hex(offset))
+    return data[offset:end].decode('utf-16-be', 'surrogatepass')
+
+def iter_loc(data: bytearray):
+    """Yield (category name, {entry id: string}) for each category in turn.
+
+    Only one category is decoded at a time, so output can be written as it goes.
+    """
+    num_categories = struct.unpack(">I", data[0x0:0x4])[0]
+    for i in range(num_categories):
+        LEN_CATEGORY_BYTES = 3 * 0x4
+        c = 0x4 + LEN_CATEGORY_BYTES * i
+        category_name = readCStr(data, c)
+        entries = {}
+        category_ptr = dereferenceRelativePointer(data, c + 0x8)
+        num_entries = struct.unpack(">I", data[category_ptr:category_ptr+0x4])[0]
+        for j in range(num_entries):
+            LEN_ENTRY_BYTES = 2 * 0x4
+            e = category_ptr + 0x4 + LEN_ENTRY_BYTES * j
+            entry_id = struct.unpack(">I", data[e:e+0x4])[0]
+            ep = dereferenceRelativePointer(data, e+0x4)
+            entries[entry_id] = readU16CStr(data, ep)
+        yield category_name, entries
+
+def extract_loc(data: bytearray):
+    categories = {}
+    for category_name, entries in iter_loc(data):
+        categories[category_name] = entries
+    return categories
+
+def _format_tsv(category, entries):
+    return "".join("{}\t{}\t{}\n".format(category, entry_id, repr(entry_str))
+                   for entry_id, entry_str in entries.items())
+
+def _format_jsonl(category, entries):
+    return "".join(json.dumps({"category": category, "id": entry_id, "text": entry_str}, ensure_ascii=False) + "\n"
+                   for entry_id, entry_str in entries.items())
+
+FORMATS = {
+    # format: (extension, function formatting the lines of a category)
+    'tsv': ('.txt', _format_tsv),
+    'jsonl': ('.jsonl', _format_jsonl),
+}
+
+def convertFile(filepath: str, outputFormat: str='tsv'):
+    """Write the strings in the .loc to <filepath>.txt (or .jsonl), returning the path written.
+
+    For a .loc in a .psarc, the output goes to its path inside the archive.
+    """
+    extension, formatCategory = FORMATS[outputFormat]
+    data = psarc.readFile(filepath)
+    out_path = psarc.localPath(filepath) + extension
+    if psarc.isArchivePath(filepath):
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    # Unpaired surrogates are written as \uXXXX escapes, which is also how JSON spells them
+    with instrument.stage("loc: convert", len(data)), open(out_path, 'w', encoding='utf-8', errors='backslashreplace') as f:
+        for category, entries in iter_loc(data):
+            with instrument.stage("loc: format"):
+                text = formatCategory(category, entries)
+            with instrument.stage("write", len(text)):
+                f.write(text)
+    return out_path
+
+def _convert_job(job: tuple):
+    filepath, outputFormat = job
+    try:
+        convertFile(filepath, outputFormat)
+        return None
+    except (ValueError, OSError, struct.error) as err:
+        return "{}: {}".format(type(err).__name__, err)
+
+def _report(jobs: list, results):
+    for (filepath, outputFormat), err in zip(jobs, results):
+        print("Processing " + filepath)
+        if err is not None:
+            print("    " + err)
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Extract .loc")
+    parser.add_argument("--format", choices=sorted(FORMATS), default='tsv', help="output format (default: tsv, written to <file>.loc.txt)")
+    parser.add_argument("-j", "--jobs", type=int, help="convert the files with this many worker processes")
+    parser.add_argument("filepath", nargs="+", help="path to file or directory of .loc files, which can be in a .psarc (archive.psarc:path/inside)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrument.session(args):
+        jobs = [(filepath, args.format) for filepath, relpath in psarc.findFiles(args.filepath, '.loc')]
+        if args.jobs is not None:
+            with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+                _report(jobs, map(instrument.unwrap, executor.map(instrument.wrap(_convert_job), jobs)))
+        else:
+            _report(jobs, map(instrument.timed(_convert_job), jobs))
+
+
+if __name__ == '__main__':
+    main()
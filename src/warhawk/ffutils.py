@@ -0,0 +1,61 @@
+import struct
+from collections import namedtuple
+
+# fourCC for each compression method (byte 0x4 of an .rtt, 0x0 of an NGP texture header)
+COMPRESSION_FOURCCS = {
+    0x01: struct.pack("<I", 0), # No compression
+    0x05: struct.pack("<I", 0), # No compression
+    0x06: b'DXT1',
+    0x07: b'DXT3',
+    0x08: b'DXT5',
+}
+
+# Bytes per 4x4 block of the block-compressed formats
+BLOCK_SIZES = {b'DXT1': 8, b'DXT3': 16, b'DXT5': 16}
+
+# Bits per pixel of the uncompressed image formats
+FORMAT_BITS = {
+    0xA9FF: 8,  # Boundary mask (alpha only)
+    0xAA1B: 32, # BGRA8, Morton-swizzled
+}
+
+class MipLevel(namedtuple('MipLevel', ['offset', 'size', 'width', 'height', 'depth', 'slice_size'])):
+    '''Where a mip level is in the texture data.
+
+    A mip level of a volume texture is depth slices of slice_size bytes, one
+    after the other, so size is depth * slice_size.
+    '''
+    __slots__ = ()
+
+    def slice_offset(self, i):
+        return self.offset + i * self.slice_size
+
+def get_slice_size(width, height, fourCC, bits_per_pixel=0):
+    """Size in bytes of a width x height image.
+
+    Block-compressed images are padded to whole 4x4 blocks.
+    """
+    if fourCC in BLOCK_SIZES:
+        return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_SIZES[fourCC]
+    return width * height * bits_per_pixel // 8
+
+def get_mip_layout(width, height, num_mipmaps, fourCC, bits_per_pixel=0, depth=1):
+    """The MipLevel of each mip level, from the largest to the smallest.
+
+    Each level halves the width, height and depth (down to 1), as in a .dds.
+    """
+    layout = []
+    offset = 0
+    for i in range(num_mipmaps):
+        mip_w = max(1, width >> i)
+        mip_h = max(1, height >> i)
+        mip_d = max(1, depth >> i)
+        slice_size = get_slice_size(mip_w, mip_h, fourCC, bits_per_pixel)
+        layout.append(MipLevel(offset, slice_size * mip_d, mip_w, mip_h, mip_d, slice_size))
+        offset += slice_size * mip_d
+    return layout
+
+def get_layout_size(layout):
+    if not layout:
+        return 0
+    return layout[-1].offset + layout[-1].size
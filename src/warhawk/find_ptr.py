@@ -0,0 +1,65 @@
+import argparse
+
+from . import instrument
+from .ptrgraph import ReverseIndex, KIND_NAMES, mapFile, loadReverseIndex
+
+def printLinksTo(index: ReverseIndex, toOffset: int, level: int=1):
+    '''Print the tree of pointers leading to toOffset.
+
+    A pointer that is already on the path being printed is marked as a cycle
+    rather than followed again.
+    '''
+    links = index.linksTo(toOffset)
+    if not links:
+        return
+    if level == 1:
+        print(hex(toOffset))
+    path = {toOffset}
+    # Depth-first, using a stack of iterators rather than recursion, as chains can be long
+    stack = [(iter(links), toOffset)]
+    while stack:
+        link = next(stack[-1][0], None)
+        if link is None:
+            path.discard(stack.pop()[1])
+            continue
+        offset, kind = link
+        line = "\t" * (level + len(stack) - 1) + hex(offset) + " (" + KIND_NAMES[kind] + ")"
+        if offset in path:
+            print(line + " (cycle)")
+            continue
+        print(line)
+        path.add(offset)
+        stack.append((iter(index.linksTo(offset)), offset))
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Find pointers that might point to the given address(es)")
+    parser.add_argument("filepath", help="path to the file")
+    parser.add_argument("--range", action="store_true", help="use a range - must be accompanied by exactly two offsets (start and end)")
+    parser.add_argument("--no-cache", action="store_true", help="don't load or save the pointer index in the cache directory")
+    parser.add_argument("offset", nargs="+", help="hex offset(s) to the addresses")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+    if args.range:
+        if len(args.offset) != 2:
+            parser.error("There must be exactly two offsets when using --range")
+        start = int(args.offset[0], 16)
+        end = int(args.offset[1], 16)
+        offsets = [*range(start, end, 4)]
+    else:
+        offsets = [int(i, 16) for i in args.offset]
+
+    with instrument.session(args), instrument.job(args.filepath):
+        data = mapFile(args.filepath)
+        end = max([len(data), *(offset + 1 for offset in offsets)])
+        if end > len(data):
+            # The cached index only covers addresses within the file
+            index = ReverseIndex(data, end)
+        else:
+            index = loadReverseIndex(args.filepath, data, not args.no_cache)
+        with instrument.stage("ptr: print links"):
+            for offset in offsets:
+                printLinksTo(index, offset, 1)
+
+if __name__ == "__main__":
+    main()
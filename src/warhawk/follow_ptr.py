@@ -0,0 +1,81 @@
+import argparse
+import struct
+
+from . import instrument
+from .ptrgraph import mapFile
+
+def dereferenceRelativePointer(data: bytearray, locOfPointer: int):
+    relativeOffset = struct.unpack_from(">i", data, locOfPointer)[0]
+    offset = locOfPointer + relativeOffset
+    return offset
+
+def parseChain(chain: str):
+    '''Parse a chain of steps separated by spaces, eg. "* [2] +0x4".
+
+    *     follow the relative pointer at the current address
+    [n]   follow the nth relative pointer of the table at the current address
+          (a 32-bit count followed by the pointers, like the .ngp tables)
+    +x/-x move the current address by x (hex)
+    '''
+    steps = []
+    for token in chain.split():
+        if token == "*":
+            steps.append(("*", None))
+        elif token.startswith("[") and token.endswith("]"):
+            steps.append(("[]", int(token[1:-1], 0)))
+        elif token[0] in "+-":
+            steps.append(("+", int(token, 16)))
+        else:
+            raise ValueError("Unknown step in chain: " + token)
+    return steps
+
+def followChain(data: bytearray, offset: int, steps: list):
+    '''Follow the steps from offset, returning the address reached after each one'''
+    addresses = []
+    for op, value in steps:
+        if op == "*":
+            offset = dereferenceRelativePointer(data, offset)
+        elif op == "[]":
+            count, = struct.unpack_from(">I", data, offset)
+            if not 0 <= value < count:
+                raise ValueError("Table at {} has {} entries, there's no [{}]".format(hex(offset), count, value))
+            offset = dereferenceRelativePointer(data, offset + 4 + value * 4)
+        else:
+            offset += value
+        addresses.append(offset)
+    return addresses
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Find the address that a relative pointer points to")
+    parser.add_argument("filepath", help="path to the file")
+    parser.add_argument("--chain", help='steps to follow from each offset instead of a single pointer (eg. "* [2] +0x4"): '
+                                        '"*" follows a pointer, "[n]" follows the nth pointer of a table (count, then pointers) '
+                                        'and "+x"/"-x" add a hex offset')
+    parser.add_argument("offset", nargs="+", help="offset of the pointer in hex (eg 0x1c)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        steps = parseChain(args.chain if args.chain is not None else "*")
+    except ValueError as err:
+        parser.error(str(err))
+
+    offsets = [int(i, 16) for i in args.offset]
+    with instrument.session(args), instrument.job(args.filepath):
+        # Only the words on the way are read, so there's no need to load the whole file
+        data = mapFile(args.filepath)
+        if args.chain is None and len(offsets) == 1:
+            print(hex(dereferenceRelativePointer(data, offsets[0])))
+            return
+        for offset in offsets:
+            try:
+                with instrument.stage("ptr: follow chain"):
+                    addresses = followChain(data, offset, steps)
+                print(" -> ".join(hex(address) for address in [offset, *addresses]))
+            except ValueError as err:
+                print(hex(offset) + ": " + str(err))
+            except struct.error:
+                print(hex(offset) + ": the chain leads outside the file")
+
+if __name__ == "__main__":
+    main()
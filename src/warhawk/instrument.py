@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import heapq
+import marshal
+import cProfile
+import threading
+import contextlib
+
+# Stages and jobs are only recorded once enable() is called (eg. by --profile).
+# Until then stage() and job() hand out a shared do-nothing context manager.
+_enabled = False
+_profileSlowest = 0
+_lock = threading.Lock()
+_stages = {} # name: [seconds, bytes, calls]
+_jobs = []   # (seconds, name)
+_profiles = [] # Heap of the slowest (seconds, name, marshalled cProfile stats)
+
+class _NullStage:
+    __slots__ = ()
+
+    def add(self, size: int):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    '''Adds its wall time, bytes and a call to the totals of the named stage'''
+    __slots__ = ('name', 'size', 'start')
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+    def add(self, size: int):
+        """Count size more bytes, for when they're only known inside the stage"""
+        self.size += size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            totals = _stages.get(self.name)
+            if totals is None:
+                totals = _stages[self.name] = [0.0, 0, 0]
+            totals[0] += elapsed
+            totals[1] += self.size
+            totals[2] += 1
+
+def enable(profileSlowest: int=0):
+    """Start recording. If profileSlowest is set, each job is run under cProfile
+    and the profiles of the slowest that many are kept.
+    """
+    global _enabled, _profileSlowest
+    _enabled = True
+    _profileSlowest = profileSlowest
+
+def enabled():
+    return _enabled
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _jobs.clear()
+        _profiles.clear()
+
+def stage(name: str, size: int=0):
+    """Context manager timing a named stage (eg. "rtt: deswizzle") that
+    processes size bytes. Stages can be nested, so their times overlap.
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, size)
+
+def _keepProfile(profile: tuple):
+    if len(_profiles) < _profileSlowest:
+        heapq.heappush(_profiles, profile)
+    elif _profiles and profile > _profiles[0]:
+        heapq.heapreplace(_profiles, profile)
+
+@contextlib.contextmanager
+def _job(name: str):
+    # cProfile can only follow the thread it was started in, so jobs run in
+    # other threads are timed but not profiled
+    profiler = None
+    if _profileSlowest and threading.current_thread() is threading.main_thread():
+        profiler = cProfile.Profile()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _jobs.append((elapsed, name))
+            if profiler is not None:
+                profiler.create_stats()
+                _keepProfile((elapsed, name, marshal.dumps(profiler.stats)))
+
+def job(name: str):
+    """Context manager timing one job (a file, or a model), by name"""
+    if not _enabled:
+        return _NULL_STAGE
+    return _job(name)
+
+def _jobName(job):
+    # Jobs are usually (file, options...) tuples
+    if isinstance(job, tuple) and job:
+        job = job[0]
+    return hex(job) if isinstance(job, int) else str(job)
+
+def _take():
+    """Everything recorded so far, which is then forgotten"""
+    with _lock:
+        recorded = ({name: list(totals) for name, totals in _stages.items()}, list(_jobs), list(_profiles))
+    reset()
+    return recorded
+
+def merge(recorded: tuple):
+    """Add what a worker process recorded (from _take()) to the totals here"""
+    stages, jobs, profiles = recorded
+    with _lock:
+        for name, (seconds, size, calls) in stages.items():
+            totals = _stages.setdefault(name, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += size
+            totals[2] += calls
+        _jobs.extend(jobs)
+        for profile in profiles:
+            _keepProfile(profile)
+
+def timed(function):
+    """function, with each call recorded as a job (named after its argument)
+    when recording. For jobs run here, rather than in worker processes.
+    """
+    if not _enabled:
+        return function
+    def timedFunction(job):
+        with _job(_jobName(job)):
+            return function(job)
+    return timedFunction
+
+class _Worker:
+    '''A job function run in a worker process, which returns what was recorded
+    while running it along with its result.
+    '''
+    def __init__(self, function, profileSlowest: int):
+        self.function = function
+        self.profileSlowest = profileSlowest
+
+    def __call__(self, job):
+        # A forked worker starts with a copy of everything recorded so far
+        reset()
+        enable(self.profileSlowest)
+        with _job(_jobName(job)):
+            result = self.function(job)
+        return result, _take()
+
+def wrap(function):
+    """The job function to give a process pool, so the stages recorded in the
+    workers are added up here. Its results have to be passed through unwrap().
+    Returns function itself unless recording.
+    """
+    if not _enabled:
+        return function
+    return _Worker(function, _profileSlowest)
+
+def unwrap(result):
+    """The result of a job function from wrap(), merging what it recorded"""
+    if not _enabled:
+        return result
+    result, recorded = result
+    merge(recorded)
+    return result
+
+def report(slowest: int=20):
+    """The totals for each stage and the slowest jobs, as a dict for JSON"""
+    with _lock:
+        stages = {name: {"seconds": seconds, "bytes": size, "calls": calls,
+                         "mib_per_s": size / (1024 * 1024) / seconds if size and seconds else None}
+                  for name, (seconds, size, calls) in sorted(_stages.items(), key=lambda item: -item[1][0])}
+        jobs = sorted(_jobs, reverse=True)
+    return {
+        "stages": stages,
+        "jobs": {
+            "count": len(jobs),
+            "seconds": sum(seconds for seconds, name in jobs),
+            "slowest": [{"name": name, "seconds": seconds} for seconds, name in jobs[:slowest]],
+        },
+    }
+
+def writeReport(path: str, wallSeconds: float=None):
+    """Write report() to path as JSON. The cProfile stats of the slowest jobs
+    are written next to it as <path>.<n>.prof, which pstats (or eg. snakeviz)
+    can load.
+    """
+    result = report(max(20, _profileSlowest))
+    if wallSeconds is not None:
+        result["wall_seconds"] = wallSeconds
+    stem = os.path.splitext(path)[0]
+    result["profiles"] = []
+    for n, (seconds, name, stats) in enumerate(sorted(_profiles, reverse=True)):
+        profilePath = "{}.{}.prof".format(stem, n + 1)
+        with open(profilePath, 'wb') as f:
+            f.write(stats)
+        result["profiles"].append({"name": name, "seconds": seconds, "path": profilePath})
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=1)
+
+def addArguments(parser):
+    parser.add_argument("--profile", metavar="REPORT", help="record the time spent in each stage and write it to this JSON file")
+    parser.add_argument("--profile-slowest", type=int, default=0, metavar="N",
+                        help="with --profile, also keep a cProfile dump of the N slowest files")
+
+@contextlib.contextmanager
+def session(args):
+    """Record everything run inside it if --profile was given, writing the report at the end"""
+    if args.profile is None:
+        yield
+        return
+    enable(args.profile_slowest)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        writeReport(args.profile, time.perf_counter() - start)
+        print("Wrote profile to " + args.profile, file=sys.stderr)
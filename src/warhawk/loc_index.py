@@ -0,0 +1,245 @@
+import os
+import mmap
+import struct
+import argparse
+
+from . import psarc
+from . import manifest
+from . import instrument
+from . import extract_loc
+
+TOOL_VERSION = 1
+
+# Index file layout (big-endian, like the game files):
+#   Header      magic, version, number of categories, number of records,
+#               offsets of the category table, records, name pool and string pool
+#   Categories  (name offset, name length, first record, record count), sorted by name
+#   Records     (entry id, string offset, string length), sorted by id within each category
+#   Name pool   category names (latin-1)
+#   String pool strings (UTF-16-BE, as in the .loc)
+INDEX_MAGIC = b'WHLI'
+INDEX_VERSION = 1
+INDEX_EXTENSION = '.locidx'
+_HEADER = struct.Struct(">4s7I")
+_CATEGORY = struct.Struct(">4I")
+_RECORD = struct.Struct(">3I")
+
+def compileIndex(data: bytearray):
+    """The contents of an index file for the .loc data."""
+    categories = []
+    records = bytearray()
+    names = bytearray()
+    pool = bytearray()
+    numRecords = 0
+    for category_name, entries in extract_loc.iter_loc(data):
+        name = category_name.encode('latin-1')
+        categories.append((name, len(names), numRecords, len(entries)))
+        names += name
+        for entry_id in sorted(entries):
+            string = entries[entry_id].encode('utf-16-be', 'surrogatepass')
+            records += _RECORD.pack(entry_id, len(pool), len(string))
+            pool += string
+        numRecords += len(entries)
+    categories.sort(key=lambda category: category[0])
+
+    categoriesOffset = _HEADER.size
+    recordsOffset = categoriesOffset + len(categories) * _CATEGORY.size
+    namesOffset = recordsOffset + len(records)
+    poolOffset = namesOffset + len(names)
+    header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(categories), numRecords,
+                          categoriesOffset, recordsOffset, namesOffset, poolOffset)
+    table = b''.join(_CATEGORY.pack(nameOffset, len(name), first, count)
+                     for name, nameOffset, first, count in categories)
+    return b''.join((header, table, records, names, pool))
+
+def buildIndex(locPath: str, out_path: str):
+    """Compile the .loc at locPath into an index file at out_path."""
+    data = psarc.readFile(locPath)
+    with instrument.stage("loc: compile index", len(data)):
+        contents = compileIndex(data)
+    tmp_path = out_path + '.tmp'
+    with instrument.stage("write", len(contents)), open(tmp_path, 'wb') as f:
+        f.write(contents)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def indexPath(locPath: str, outdir: str, relpath: str=None):
+    """Where the index of the .loc goes in outdir: at its relpath (as findFiles()
+    gives it), so .loc files with the same name in different directories don't
+    share an index.
+    """
+    return os.path.join(outdir, os.path.splitext(relpath or os.path.basename(locPath))[0] + INDEX_EXTENSION)
+
+class LocIndex:
+    '''A compiled index of one language's strings, memory-mapped.
+
+    Only the category table is read when opening it. Each lookup is a binary
+    search over the records of one category followed by decoding that one
+    string, so it doesn't get slower (or use more memory) as the data grows.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, numCategories, self.__numRecords, categoriesOffset,
+             self.__recordsOffset, namesOffset, self.__poolOffset) = _HEADER.unpack_from(self.__data, 0)
+        except struct.error:
+            magic = version = None
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError("Not a version {} loc index: {}".format(INDEX_VERSION, path))
+        self.__categories = {}
+        for offset in range(categoriesOffset, categoriesOffset + numCategories * _CATEGORY.size, _CATEGORY.size):
+            nameOffset, nameLength, first, count = _CATEGORY.unpack_from(self.__data, offset)
+            start = namesOffset + nameOffset
+            self.__categories[self.__data[start:start+nameLength].decode('latin-1')] = (first, count)
+
+    def categories(self):
+        return sorted(self.__categories)
+
+    def __len__(self):
+        return self.__numRecords
+
+    def __record(self, i: int):
+        return _RECORD.unpack_from(self.__data, self.__recordsOffset + i * _RECORD.size)
+
+    def __string(self, offset: int, length: int):
+        start = self.__poolOffset + offset
+        return self.__data[start:start+length].decode('utf-16-be', 'surrogatepass')
+
+    def get(self, category: str, entry_id: int, default=None):
+        found = self.__categories.get(category)
+        if found is None:
+            return default
+        lo, hi = found[0], found[0] + found[1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_id, offset, length = self.__record(mid)
+            if mid_id < entry_id:
+                lo = mid + 1
+            elif mid_id > entry_id:
+                hi = mid
+            else:
+                return self.__string(offset, length)
+        return default
+
+    def entries(self, category: str):
+        '''Yield (entry id, string) for each entry of the category, in id order'''
+        first, count = self.__categories.get(category, (0, 0))
+        for i in range(first, first + count):
+            entry_id, offset, length = self.__record(i)
+            yield entry_id, self.__string(offset, length)
+
+    def close(self):
+        self.__data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LocIndexSet:
+    '''The LocIndex of every language in a directory (and its subdirectories), keyed
+    by language: the path of the .loc without its extension, eg. "english/language_0"
+    '''
+    def __init__(self, directory: str):
+        self.languages = {}
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(INDEX_EXTENSION):
+                    path = os.path.join(root, name)
+                    language = os.path.relpath(path, directory)[:-len(INDEX_EXTENSION)].replace(os.sep, '/')
+                    self.languages[language] = LocIndex(path)
+
+    def get(self, language: str, category: str, entry_id: int, default=None):
+        index = self.languages.get(language)
+        if index is None:
+            return default
+        return index.get(category, entry_id, default)
+
+    def lookup(self, category: str, entry_id: int):
+        '''{language: string} for every language that has the entry'''
+        result = {}
+        for language, index in self.languages.items():
+            string = index.get(category, entry_id)
+            if string is not None:
+                result[language] = string
+        return result
+
+    def close(self):
+        for index in self.languages.values():
+            index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def buildIndexes(paths: list, outdir: str, records: manifest.Manifest=None):
+    """Build the index of each .loc (or .loc in a directory) into outdir.
+
+    With a Manifest, .loc files that haven't changed since their index was
+    built are skipped. Returns the number of indexes built.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    built = 0
+    for locPath, relpath in psarc.findFiles(paths, '.loc'):
+        out_path = indexPath(locPath, outdir, relpath)
+        def build():
+            print("Indexing " + locPath)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with instrument.job(locPath):
+                buildIndex(locPath, out_path)
+            return [out_path]
+        try:
+            if records is None:
+                build()
+            elif not records.update(records.key(locPath), [locPath], {'output': os.path.abspath(out_path)}, build):
+                continue
+        except (ValueError, OSError, struct.error) as err:
+            print("    {}: {}".format(type(err).__name__, err))
+            continue
+        built += 1
+    if records is not None:
+        records.save()
+    return built
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Build and query memory-mapped indexes of the strings in .loc files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="build an index for each .loc")
+    build.add_argument("-o", "--outdir", required=True, help="directory to write the indexes to")
+    build.add_argument("--manifest", help="path to a manifest file used to skip .loc files whose index is up to date")
+    build.add_argument("filepath", nargs="+", help="path to .loc file or directory of .loc files, which can be in a .psarc (archive.psarc:path/inside)")
+    instrument.addArguments(build)
+    lookup = subparsers.add_parser("lookup", help="print a string in every language")
+    lookup.add_argument("directory", help="directory of indexes")
+    lookup.add_argument("category", help="category name")
+    lookup.add_argument("entry_id", help="entry id (decimal, or hex with 0x)")
+    instrument.addArguments(lookup)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        records = None
+        if args.manifest is not None:
+            records = manifest.Manifest(args.manifest, "loc_index", TOOL_VERSION)
+        with instrument.session(args):
+            buildIndexes(args.filepath, args.outdir, records)
+        return
+
+    with instrument.session(args):
+        with instrument.stage("loc: open indexes"):
+            indexes = LocIndexSet(args.directory)
+        with indexes:
+            with instrument.stage("loc: lookup"):
+                strings = indexes.lookup(args.category, int(args.entry_id, 0))
+            for language, string in strings.items():
+                print("{}\t{}".format(language, repr(string)))
+
+if __name__ == "__main__":
+    main()
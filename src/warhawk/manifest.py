@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import hashlib
+
+from . import psarc
+
+MANIFEST_VERSION = 1
+
+def hashFile(path: str):
+    h = hashlib.blake2b(digest_size=16)
+    with psarc.openFile(path) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _stat(path: str):
+    try:
+        return psarc.stat(path)
+    except FileNotFoundError:
+        return None, None
+
+def _settingsHash(settings):
+    return hashlib.blake2b(json.dumps(settings, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+def fingerprint(sources: list):
+    """Describe the current state (size, mtime and content hash) of the sources.
+
+    Missing sources are recorded too, so that their appearance is noticed.
+    Take it before converting, so that a source changing mid-conversion is
+    converted again next time.
+    """
+    result = []
+    for source in sources:
+        path = os.path.abspath(source)
+        size, mtime = _stat(path)
+        result.append({
+            'path': path,
+            'size': size,
+            'mtime': mtime,
+            'hash': hashFile(path) if size is not None else None,
+        })
+    return result
+
+class Manifest:
+    '''Record of converted files, used to skip outputs that are already up to date.
+
+    Entries are kept per tool (dropped when the tool bumps its version) and keyed
+    by the main source file. Each records the sources' size, mtime and content
+    hash, and a hash of the settings (eg. --outdir) the outputs were made with;
+    the content is only hashed again when the size or mtime changed.
+    '''
+    def __init__(self, path: str=None, tool: str='', version: int=0):
+        self.path = path
+        self.__dirty = False
+        self.__tools = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.__tools = data['tools']
+        tool_data = self.__tools.get(tool)
+        if tool_data is None or tool_data['version'] != version:
+            tool_data = {'version': version, 'entries': {}}
+            self.__tools[tool] = tool_data
+            self.__dirty = True
+        self.__entries = tool_data['entries']
+
+    @staticmethod
+    def key(path: str):
+        return os.path.abspath(path)
+
+    def isUpToDate(self, key: str, sources: list, settings=None):
+        """Whether the outputs of key exist and were made from the sources as
+        they are now, with the same settings (any JSON-serialisable value).
+        """
+        entry = self.__entries.get(key)
+        if entry is None or entry.get('settings') != _settingsHash(settings):
+            return False
+        if not all(os.path.exists(output) for output in entry['outputs']):
+            return False
+        recorded = entry['sources']
+        if [s['path'] for s in recorded] != [os.path.abspath(s) for s in sources]:
+            return False
+        stats = [_stat(s['path']) for s in recorded]
+        if all(stat == (s['size'], s['mtime']) for stat, s in zip(stats, recorded)):
+            return True
+
+        # Size or mtime changed, check whether the content did too
+        current = fingerprint(sources)
+        if [s['hash'] for s in current] != [s['hash'] for s in recorded]:
+            return False
+        entry['sources'] = current
+        self.__dirty = True
+        return True
+
+    def record(self, key: str, sources_fingerprint: list, outputs: list, settings=None):
+        self.__entries[key] = {
+            'sources': sources_fingerprint,
+            'outputs': [os.path.abspath(output) for output in outputs],
+            'settings': _settingsHash(settings),
+        }
+        self.__dirty = True
+
+    def update(self, key: str, sources: list, settings, convert):
+        """Call convert() unless the outputs of key are up to date, and record
+        the outputs it returns. Returns whether convert() was called.
+
+        convert() returns None when only part of the conversion worked, which
+        leaves key to be converted again next time.
+        """
+        if self.isUpToDate(key, sources, settings):
+            return False
+        sources_fingerprint = fingerprint(sources)
+        outputs = convert()
+        if outputs is not None:
+            self.record(key, sources_fingerprint, outputs, settings)
+        return True
+
+    def save(self):
+        if self.path is None or not self.__dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'tools': self.__tools}, f)
+        os.replace(tmp_path, self.path)
+        self.__dirty = False
+
+def watch(run, interval: float=1.0):
+    """Call run() every interval seconds until interrupted.
+
+    run() is expected to check a Manifest, so only files that changed since the
+    previous call get converted again. Errors are reported but don't stop the
+    watch, as files are often caught halfway through being written.
+    """
+    try:
+        while True:
+            try:
+                run()
+            except Exception as err:
+                print("Error: {}".format(err))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,138 @@
+import sys
+import json
+import struct
+import argparse
+import concurrent.futures
+
+from . import psarc
+from . import ffutils
+from . import instrument
+from . import ngp_models
+from . import ngp_textures
+from .NgpFile import NgpFile
+from .IntervalIndex import IntervalIndex
+
+def _markTables(ngp: NgpFile):
+    """Mark the header and the tables it points to that no parser reads as a whole."""
+    ngp.mark(True, 0, 0x20, "header")
+    table1 = ngp.dereferenceRelativePointer(0x0C)
+    numberOfEntries, = struct.unpack_from(">I", ngp.ngp, table1)
+    ngp.mark(True, table1, 4 + numberOfEntries * 4, "table 1")
+    table3 = ngp.dereferenceRelativePointer(0x14)
+    numberOfEntries, = struct.unpack_from(">H", ngp.ngp, table3 + 0x2)
+    ngp.mark(True, table3, 8 + numberOfEntries * 4, "table 3")
+
+def _markTexture(ngp: NgpFile, header: bytearray):
+    """Mark the data of a texture from the size its header gives, without reading it."""
+    isInNGP = header[0x8] == 0x1
+    loc, = struct.unpack(">I", header[0xc:0x10])
+    size = ffutils.get_layout_size(ngp_textures.textureLayout(header))
+    available = max(0, len(ngp.data(isInNGP)) - loc)
+    ngp.mark(isInNGP, loc, min(size, available), "texture data")
+    if size > available:
+        raise ValueError("Texture data extends past the end of the " + (".ngp" if isInNGP else ".vram"))
+
+def _describe(index: IntervalIndex, size: int):
+    explained = 0
+    ranges = []
+    for segment in index.coverageMap(size):
+        kinds = sorted(set(kind for kind, owner in segment.regions))
+        ranges.append({"start": segment.start, "end": segment.end, "regions": kinds})
+        if segment.regions:
+            explained += segment.end - segment.start
+    overlaps = [{"start": segment.start, "end": segment.end,
+                 "regions": [kind if owner is None else "{} ({})".format(kind, hex(owner))
+                             for kind, owner in segment.regions]}
+                for segment in index.overlaps(size)]
+    return {"size": size, "explained": explained, "unknown": size - explained,
+            "ranges": ranges, "overlaps": overlaps}
+
+def coverage(filename: str):
+    """Decode everything the parsers understand in the .ngp (and its .vram) and
+    return a report of which bytes of each file that explained.
+
+    Models or textures that fail to decode are listed in the report's errors.
+    """
+    filenameStem = ".".join(filename.split(".")[:-1])
+    indexes = {True: IntervalIndex(), False: IntervalIndex()}
+    errors = []
+    with NgpFile(filenameStem) as ngp:
+        ngp.recorder = lambda isInNGP, start, length, kind, owner: indexes[isInNGP].add(start, start + length, kind, owner)
+        try:
+            _markTables(ngp)
+        except struct.error as err:
+            errors.append("Tables: {}: {}".format(type(err).__name__, err))
+        try:
+            for i, textureHeaderOffset, header in ngp_textures.textureHeaders(ngp):
+                try:
+                    _markTexture(ngp, header)
+                except (ValueError, struct.error) as err:
+                    errors.append("Texture {}: {}: {}".format(hex(textureHeaderOffset), type(err).__name__, err))
+        except struct.error as err:
+            errors.append("Table 2: {}: {}".format(type(err).__name__, err))
+        for loc, magic, length in ngp_models.indexModelHeaders(ngp.ngp):
+            try:
+                ngp_models.decodeModel(ngp, loc)
+            except Exception as err:
+                errors.append("Model {}: {}: {}".format(hex(loc), type(err).__name__, err))
+
+        report = {"path": filename, "ngp": _describe(indexes[True], len(ngp.ngp))}
+        if len(indexes[False]):
+            report["vram"] = _describe(indexes[False], len(ngp.vram))
+    report["errors"] = errors
+    return report
+
+def _coverage_job(filename: str):
+    try:
+        return coverage(filename)
+    except (OSError, ValueError, struct.error) as err:
+        return {"path": filename, "errors": ["{}: {}".format(type(err).__name__, err)]}
+
+def _printFile(name: str, description: dict, showRanges: bool):
+    size = description["size"]
+    percent = 100.0 * description["explained"] / size if size else 100.0
+    print("  {}: {:.1f}% explained, 0x{:x} of 0x{:x} bytes unknown, {} overlaps".format(
+        name, percent, description["unknown"], size, len(description["overlaps"])))
+    if showRanges:
+        for r in description["ranges"]:
+            print("    {:>10} - {:<10} {}".format(hex(r["start"]), hex(r["end"]),
+                                                  ", ".join(r["regions"]) or "unknown"))
+    for overlap in description["overlaps"]:
+        print("    Overlap {} - {}: {}".format(hex(overlap["start"]), hex(overlap["end"]),
+                                              ", ".join(overlap["regions"])))
+
+def printReport(report: dict, showRanges: bool=True):
+    print(report["path"])
+    for name in ("ngp", "vram"):
+        if name in report:
+            _printFile("." + name, report[name], showRanges)
+    for err in report["errors"]:
+        print("  Error: " + err)
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Show which bytes of .ngp (and .vram) files are explained by the known structures")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes when there are several files")
+    parser.add_argument("--json", action="store_true", help="write the reports as JSON")
+    parser.add_argument("--summary", action="store_true", help="only print the totals and overlaps, not every range")
+    parser.add_argument("filepath", nargs="+", help="path to .ngp file (make sure corresponding .vram is in the same path) or directory of .ngp files")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    files = [filepath for filepath, relpath in psarc.findFiles(args.filepath, '.ngp')]
+    with instrument.session(args):
+        if args.jobs is not None and len(files) > 1:
+            with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+                reports = list(map(instrument.unwrap, executor.map(instrument.wrap(_coverage_job), files)))
+        else:
+            reports = list(map(instrument.timed(_coverage_job), files))
+
+    if args.json:
+        json.dump(list(reports), sys.stdout, indent=1)
+        print()
+        return
+    for report in reports:
+        printReport(report, not args.summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,757 @@
+import os
+import sys
+import json
+import array
+import argparse
+import struct
+import collections
+import concurrent.futures
+from . import psarc
+from . import rtt2dds
+from . import optional
+from . import manifest
+from . import instrument
+from . import ngp_textures
+from .NgpFile import NgpFile
+from .TextureStore import TextureStore
+
+TOOL_VERSION = 1
+
+def _records(data, dtype: str, offset: int, count: int, stride: int, fields: int):
+    """View of count records of fields values each, stride bytes apart, in data.
+
+    Records that would run past the end of data are dropped. The view refers to
+    data, so it should be copied (eg. with astype) before data is closed.
+    """
+    np = optional.numpy()
+    if stride <= 0:
+        raise ValueError("Invalid stride 0x{:x}".format(stride))
+    itemsize = np.dtype(dtype).itemsize
+    available = len(data) - offset - (fields * itemsize)
+    if offset < 0 or available < 0:
+        count = 0
+    count = max(0, min(count, available // stride + 1))
+    if count == 0:
+        return np.empty((0, fields), dtype=dtype)
+    return np.ndarray((count, fields), dtype=dtype, buffer=data, offset=offset,
+                      strides=(stride, itemsize))
+
+def _findUVLinker(header: bytearray, linker_start: int):
+    """(inter-value distance, isDataInNGP, data offset) of the UV linker, or None."""
+    for i in range(linker_start, len(header), 0x0C):
+        linker = header[i:i+0x0C]
+        if linker[0:4] == struct.pack(">I", 0x00080003): # I think this identifies the UV coords
+            repeatLength = linker[0x4]
+            isDataInNGP = linker[0x6] == 0x01
+            offset, = struct.unpack(">I", linker[0x08:0x08+0x04])
+            return repeatLength, isDataInNGP, offset
+    return None
+
+def decodeUVs(ngp: NgpFile, header: bytearray, count: int, linker_start: int = 0x38):
+    """UV coordinates as a (count, 2) float array, with Y flipped."""
+    np = optional.numpy()
+    linker = _findUVLinker(header, linker_start)
+    if linker is None:
+        return np.empty((0, 2), dtype=np.float64)
+    repeatLength, isDataInNGP, offset = linker
+    uvs = _records(ngp.data(isDataInNGP), ">f2", offset, count, repeatLength, 2).astype(np.float64)
+    uvs[:, 1] = 1 - uvs[:, 1] # Flip Y because textures are flipped
+    return uvs
+
+def decodeFaces(ngp: NgpFile, facesOffset: int, numberOfIndicesUsedInFaces: int):
+    """Faces as an (n, 3) int array of vertex indices (indexed from 1)."""
+    np = optional.numpy()
+    numberOfFaces = int(numberOfIndicesUsedInFaces / 3) # 3 vertices per face
+    return _records(ngp.ngp, ">u2", facesOffset, numberOfFaces, 6, 3).astype(np.int64) + 1
+
+def decodeVertices(ngp: NgpFile, vertexOffset: int, numberOfVertices: int, scales=(1.0, 1.0, 1.0)):
+    """Type 1 (scaled short) vertices as an (n, 3) float array."""
+    np = optional.numpy()
+    vertices = _records(ngp.ngp, ">i2", vertexOffset, numberOfVertices, 6, 3).astype(np.float64)
+    return vertices / 32768.0 * np.array(scales, dtype=np.float64)
+
+def decodeVerticesType2(ngp: NgpFile, vertexOffset: int, numberOfVertices: int):
+    """Type 2 (float) vertices as an (n, 3) float array."""
+    np = optional.numpy()
+    stride = 0x14  # 12 bytes float32 XYZ + 8 bytes packed normals
+    return _records(ngp.ngp, ">f4", vertexOffset, numberOfVertices, stride, 3).astype(np.float64)
+
+def toYUp(vertices):
+    """Remap game (Z-up) vertices to Y-up: X=X, Y=Z, Z=-Y."""
+    np = optional.numpy()
+    return np.column_stack((vertices[:, 0], vertices[:, 2], -vertices[:, 1]))
+
+def getUVs(ngp: NgpFile, header: bytearray, count: int, linker_start: int = 0x38):
+    np = optional.numpy()
+    if np is not None:
+        return decodeUVs(ngp, header, count, linker_start).tolist()
+    uvs = []
+    linker = _findUVLinker(header, linker_start)
+    if linker is None:
+        return uvs
+    repeatLength, isDataInNGP, offset = linker
+
+    data = ngp.data(isDataInNGP)
+    for i in range(offset, offset + (count * repeatLength), repeatLength):
+        uvCoords = []
+        curr_x, = struct.unpack(">e", data[i:i+2])
+        curr_y, = struct.unpack(">e", data[i+2:i+4])
+        uvCoords.append(curr_x)
+        uvCoords.append(1 - curr_y) # Flip Y because textures are flipped
+        uvs.append(uvCoords)
+    return uvs
+
+def getFaces(ngp: NgpFile, facesOffset: int, numberOfIndicesUsedInFaces: int):
+    np = optional.numpy()
+    if np is not None:
+        return decodeFaces(ngp, facesOffset, numberOfIndicesUsedInFaces).tolist()
+    numberOfFaces = int(numberOfIndicesUsedInFaces / 3) # 3 vertices per face
+    facesRaw = ngp.ngp[facesOffset:facesOffset+(numberOfFaces*6)]
+    faces = []
+    for i in range(0, len(facesRaw), 6):
+        faceVertices = []
+        for j in range(0, 6, 2):
+            val, = struct.unpack(">H", facesRaw[i+j:i+j+2])
+            faceVertices.append(val + 1) # Index from 1
+        faces.append(faceVertices)
+    return faces
+
+def getVertices(ngp: NgpFile, vertexOffset: int, numberOfVertices: int, scales=(1.0, 1.0, 1.0)):
+    np = optional.numpy()
+    if np is not None:
+        return decodeVertices(ngp, vertexOffset, numberOfVertices, scales).tolist()
+    verticesRaw = ngp.ngp[vertexOffset:vertexOffset+(numberOfVertices*6)]
+    vertices = []
+    for i in range(0, len(verticesRaw), 6):
+        vertexCoords = []
+        for j, scale in zip(range(0, 6, 2), scales):
+            val, = struct.unpack(">h", verticesRaw[i+j:i+j+2])
+            vertexCoords.append(val / 32768.0 * scale)
+        vertices.append(vertexCoords)
+    return vertices
+
+def getVerticesType2(ngp: NgpFile, vertexOffset: int, numberOfVertices: int):
+    np = optional.numpy()
+    if np is not None:
+        return decodeVerticesType2(ngp, vertexOffset, numberOfVertices).tolist()
+    stride = 0x14  # 12 bytes float32 XYZ + 8 bytes packed normals
+    vertices = []
+    for i in range(numberOfVertices):
+        base = vertexOffset + i * stride
+        x, y, z = struct.unpack(">fff", ngp.ngp[base:base+12])
+        vertices.append([x, y, z])
+    return vertices
+
+def _count_type2_linkers(data: bytearray, h: int) -> int:
+    """Count Type-2 linkers by scanning for valid linker idents (low 2 bytes == 0x0003 or 0x0004)."""
+    n = 0
+    for i in range(0x48, 0x48 + 10 * 0x0C, 0x0C):
+        if h + i + 4 > len(data):
+            break
+        ident, = struct.unpack(">I", data[h+i:h+i+4])
+        if (ident & 0xFFFF) in (0x0003, 0x0004):
+            n += 1
+        else:
+            break
+    return n
+
+def extractNGPTexture(ngp: NgpFile, headerLoc: int):
+    rttmod_header = bytearray(ngp.ngp[headerLoc:headerLoc+0x10])
+    return ngp_textures.readTexture(ngp, rttmod_header)
+
+def _findTextureHeader(ngp: NgpFile, headerOffset: int):
+    ngp_data = ngp.ngp
+    ptr = ngp.dereferenceRelativePointer(headerOffset+0x04)
+    dataptr = ngp.dereferenceRelativePointer(ptr+0x10)
+    textureHeaderOffset = -1
+    for i in range(0, ptr - dataptr, 4):
+        if (ngp_data[dataptr+i:dataptr+i+4] == struct.pack(">I", 0x00111122) and
+                ngp_data[dataptr+i+4:dataptr+i+8] != struct.pack(">I", 0x00)):
+            textureHeaderOffset = ngp.dereferenceRelativePointer(dataptr+i+4)
+            ngp.mark(True, dataptr+i, 8, "texture link", headerOffset)
+    if textureHeaderOffset != -1:
+        ngp.mark(True, textureHeaderOffset, 0x10, "texture header", textureHeaderOffset)
+    return textureHeaderOffset
+
+def _markModel(ngp: NgpFile, headerOffset: int, header: bytearray, linker_start: int,
+               facesOffset: int, numberOfFaces: int, vertexOffset: int, vertexStride: int, numberOfVertices: int):
+    """Report the regions a model was decoded from (see NgpFile.mark())."""
+    if ngp.recorder is None:
+        return
+    ngp.mark(True, headerOffset, len(header), "model header", headerOffset)
+    ngp.mark(True, facesOffset, numberOfFaces * 6, "faces", headerOffset)
+    ngp.mark(True, vertexOffset, numberOfVertices * vertexStride, "vertices", headerOffset)
+    linker = _findUVLinker(header, linker_start)
+    if linker is not None and numberOfVertices > 0:
+        # The UVs are interleaved with other data, so only the span they are read from is known
+        repeatLength, isDataInNGP, offset = linker
+        ngp.mark(isDataInNGP, offset, (numberOfVertices - 1) * repeatLength + 4, "uvs", headerOffset)
+
+# A decoded model. vertices, faces and uvs are arrays if NumPy is available, otherwise lists.
+Model = collections.namedtuple("Model", ["headerOffset", "vertices", "faces", "uvs",
+                                         "textureHeaderOffset", "flip_winding"])
+
+def decodeModel(ngp: NgpFile, headerOffset: int):
+    with instrument.stage("ngp: decode geometry"):
+        return _decodeModel(ngp, headerOffset)
+
+def _decodeModel(ngp: NgpFile, headerOffset: int):
+    np = optional.numpy()
+    ngp_data = ngp.ngp
+    magic, = struct.unpack(">I", ngp_data[headerOffset:headerOffset+4])
+
+    if magic == 1:
+        numLinkers = ngp_data[headerOffset+0x26]
+        headerSize = 0x2C + (numLinkers * 0x0C)
+        header = ngp_data[headerOffset:headerOffset+headerSize]
+        numberOfVertices, = struct.unpack(">H", header[0x24:0x24+2])
+        numberOfIndicesUsedInFaces, = struct.unpack(">I", header[0x1c:0x1c+4])
+        facesOffset, = struct.unpack(">I", header[0x28:0x28+4])
+        vertexOffset, = struct.unpack(">I", header[0x34:0x34+4])
+        sx, sy, sz = struct.unpack(">fff", header[0x08:0x14])
+        if np is not None:
+            faces = decodeFaces(ngp, facesOffset, numberOfIndicesUsedInFaces)
+            vertices = decodeVertices(ngp, vertexOffset, numberOfVertices, scales=(sx, sy, sz))
+            uvs = decodeUVs(ngp, header, numberOfVertices)
+        else:
+            faces = getFaces(ngp, facesOffset, numberOfIndicesUsedInFaces)
+            vertices = getVertices(ngp, vertexOffset, numberOfVertices, scales=(sx, sy, sz))
+            uvs = getUVs(ngp, header, numberOfVertices)
+        _markModel(ngp, headerOffset, header, 0x38, facesOffset, numberOfIndicesUsedInFaces // 3,
+                   vertexOffset, 6, numberOfVertices)
+    elif magic == 2:
+        numLinkers = _count_type2_linkers(ngp_data, headerOffset)
+        headerSize = 0x48 + (numLinkers * 0x0C)
+        header = ngp_data[headerOffset:headerOffset+headerSize]
+        facesOffset, = struct.unpack(">I", header[0x44:0x48])
+        vertexOffset = ngp.dereferenceRelativePointer(headerOffset+0x24)
+        # Face data always fills exactly up to vertex data
+        numberOfIndicesUsedInFaces = (vertexOffset - facesOffset) // 6 * 3
+        # Derive vertex count from face data (faces are 1-indexed)
+        if np is not None:
+            faces = decodeFaces(ngp, facesOffset, numberOfIndicesUsedInFaces)
+            numberOfVertices = int(faces.max())
+            vertices = decodeVerticesType2(ngp, vertexOffset, numberOfVertices)
+            uvs = decodeUVs(ngp, header, numberOfVertices, linker_start=0x48)
+        else:
+            faces = getFaces(ngp, facesOffset, numberOfIndicesUsedInFaces)
+            numberOfVertices = max(v for face in faces for v in face)
+            vertices = getVerticesType2(ngp, vertexOffset, numberOfVertices)
+            uvs = getUVs(ngp, header, numberOfVertices, linker_start=0x48)
+        _markModel(ngp, headerOffset, header, 0x48, facesOffset, numberOfIndicesUsedInFaces // 3,
+                   vertexOffset, 0x14, numberOfVertices)
+    else:
+        raise ValueError(f"Unknown magic 0x{magic:08x}")
+
+    textureHeaderOffset = _findTextureHeader(ngp, headerOffset)
+    return Model(headerOffset, vertices, faces, uvs, textureHeaderOffset, magic == 2)
+
+def extractModel(ngp: NgpFile, headerOffset: int, precision: int=None, textureStore: TextureStore=None):
+    model = decodeModel(ngp, headerOffset)
+    return exportAsObj(ngp, headerOffset, model.vertices, model.faces, model.uvs,
+                       model.textureHeaderOffset, model.flip_winding, precision, textureStore)
+
+# Number of lines formatted at a time when writing .obj files
+_OBJ_BATCH_LINES = 0x4000
+
+def _formatLines(template: str, values: list, valuesPerLine: int):
+    """Format the flattened values, valuesPerLine at a time, with template."""
+    batch = _OBJ_BATCH_LINES * valuesPerLine
+    blocks = []
+    for i in range(0, len(values), batch):
+        chunk = values[i:i+batch]
+        blocks.append((template * (len(chunk) // valuesPerLine)) % tuple(chunk))
+    return "".join(blocks)
+
+def formatObj(modelName: str, vertices, faces, uvs, hasTexture: bool=False, flip_winding: bool=False, precision: int=None):
+    """The contents of an .obj for the model.
+
+    vertices, faces and uvs can be lists or arrays. By default, floats are
+    written in full (repr) precision, otherwise with precision decimal places.
+    """
+    np = optional.numpy()
+    if np is not None:
+        # game uses Z-up; remap to OBJ Y-up
+        vertices = toYUp(np.asarray(vertices, dtype=np.float64).reshape(-1, 3)).ravel().tolist()
+        uvs = np.asarray(uvs, dtype=np.float64).reshape(-1, 2).ravel().tolist()
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if flip_winding:
+            faces = faces[:, ::-1]
+        faces = np.repeat(faces, 2, axis=1).ravel().tolist()
+    else:
+        vertices = [c for x, y, z in vertices for c in (x, z, -y)]
+        uvs = [c for uv in uvs for c in uv]
+        faces = [v for face in faces for v in (face[::-1] if flip_winding else face) for _ in range(2)]
+
+    num = "%s" if precision is None else "%.{}f".format(precision)
+    lines = []
+    if hasTexture:
+        lines.append("mtllib " + modelName + ".mtl\n")
+        lines.append("usemtl Textured\n")
+    lines.append("o " + modelName + "\n")
+    lines.append(_formatLines("v {0} {0} {0}\n".format(num), vertices, 3))
+    lines.append(_formatLines("vt {0} {0}\n".format(num), uvs, 2))
+    lines.append(_formatLines("f %d/%d %d/%d %d/%d\n", faces, 6))
+    return "".join(lines)
+
+def formatMtl(textureFilename: str):
+    """The contents of the .mtl for a model textured with textureFilename."""
+    return "newmtl Textured\nKd 1.0 1.0 1.0\nmap_Kd " + textureFilename + "\n"
+
+def _storedTexture(ngp: NgpFile, textureHeaderOffset: int, textureStore: TextureStore):
+    return textureStore.get(ngp.filenameStem + ".ngp", textureHeaderOffset,
+                            lambda: extractNGPTexture(ngp, textureHeaderOffset))
+
+def _exportTexture(ngp: NgpFile, textureHeaderOffset: int, modelName: str, textureStore: TextureStore=None):
+    if textureStore is not None:
+        texturePath = _storedTexture(ngp, textureHeaderOffset, textureStore)
+        textureFilename = os.path.relpath(texturePath, os.path.dirname(modelName) or ".").replace(os.sep, "/")
+    else:
+        texturePath = textureFilename = modelName + ".dds"
+        rttdata = extractNGPTexture(ngp, textureHeaderOffset)
+        ddsdata = rtt2dds.rtt2dds(rttdata)
+        with instrument.stage("write", len(ddsdata)), open(textureFilename, "wb") as f:
+            f.write(ddsdata)
+
+    with instrument.stage("write"), open(modelName + ".mtl", "w") as f:
+        f.write(formatMtl(textureFilename))
+    return [texturePath, modelName + ".mtl"]
+
+def exportAsObj(ngp: NgpFile, headerOffset: int, vertices: list, faces: list, uvs: list, textureHeaderOffset: int=-1, flip_winding: bool=False, precision: int=None, textureStore: TextureStore=None):
+    """Write the model to an .obj (and .mtl/.dds if textured), returning the paths written.
+
+    The texture is extracted and written while the .obj is being written. If a
+    textureStore is given, the .mtl refers to the texture's .dds in the store.
+    """
+    modelName = ngp.outputStem + "_" + hex(headerOffset)
+    outputs = [modelName + ".obj"]
+    hasTexture = textureHeaderOffset != -1
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        if hasTexture:
+            texture = executor.submit(_exportTexture, ngp, textureHeaderOffset, modelName, textureStore)
+        with instrument.stage("obj: format"):
+            objdata = formatObj(modelName, vertices, faces, uvs, hasTexture, flip_winding, precision)
+        with instrument.stage("write", len(objdata)), open(modelName + ".obj", "w") as f:
+            f.write(objdata)
+        if hasTexture:
+            outputs += texture.result()
+    return outputs
+
+def _packValues(values, typecode: str):
+    """Pack a flat sequence of numbers as little-endian array.array typecode values."""
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+class GlbScene:
+    '''A binary glTF (.glb) scene of models, with all the data in one shared buffer.
+
+    Textures are DDS files, so they are added using the MSFT_texture_dds
+    extension, either embedded in the buffer or referenced by a relative uri.
+    '''
+    def __init__(self):
+        self.__gltf = {
+            "asset": {"version": "2.0", "generator": "warhawk-reversing ngp_models"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "accessors": [],
+            "bufferViews": [],
+        }
+        self.__buffer = bytearray()
+
+    def __addBufferView(self, data: bytes, target: int=None):
+        self.__buffer += b"\x00" * (-len(self.__buffer) % 4)
+        bufferView = {"buffer": 0, "byteOffset": len(self.__buffer), "byteLength": len(data)}
+        if target is not None:
+            bufferView["target"] = target
+        self.__buffer += data
+        self.__gltf["bufferViews"].append(bufferView)
+        return len(self.__gltf["bufferViews"]) - 1
+
+    def __addAccessor(self, data: bytes, componentType: int, count: int, accessorType: str, target: int, **extra):
+        accessor = {
+            "bufferView": self.__addBufferView(data, target),
+            "componentType": componentType,
+            "count": count,
+            "type": accessorType,
+        }
+        accessor.update(extra)
+        self.__gltf["accessors"].append(accessor)
+        return len(self.__gltf["accessors"]) - 1
+
+    def addTexture(self, ddsdata: bytes=None, uri: str=None):
+        """Add a material for a texture, returning its index.
+
+        Either ddsdata to embed the texture, or uri to reference it, is needed.
+        """
+        if uri is not None:
+            image = {"uri": uri}
+        else:
+            image = {"bufferView": self.__addBufferView(bytes(ddsdata)), "mimeType": "image/vnd-ms.dds"}
+        images = self.__gltf.setdefault("images", [])
+        images.append(image)
+        textures = self.__gltf.setdefault("textures", [])
+        textures.append({"extensions": {"MSFT_texture_dds": {"source": len(images) - 1}}})
+        materials = self.__gltf.setdefault("materials", [])
+        materials.append({
+            "pbrMetallicRoughness": {"baseColorTexture": {"index": len(textures) - 1}, "metallicFactor": 0.0},
+        })
+        self.__gltf["extensionsUsed"] = ["MSFT_texture_dds"]
+        self.__gltf["extensionsRequired"] = ["MSFT_texture_dds"]
+        return len(materials) - 1
+
+    def addModel(self, name: str, vertices, faces, uvs, material: int=None, flip_winding: bool=False):
+        """Add a model as a mesh on its own node.
+
+        Takes the vertices, faces (indexed from 1) and uvs (flipped for OBJ) as
+        decoded by decodeModel().
+        """
+        np = optional.numpy()
+        if np is not None:
+            positions = toYUp(np.asarray(vertices, dtype=np.float64).reshape(-1, 3)).astype("<f4")
+            indices = np.asarray(faces, dtype=np.int64).reshape(-1, 3) - 1
+            if flip_winding:
+                indices = indices[:, ::-1]
+            numberOfVertices = len(positions)
+            numberOfIndices = indices.size
+            minimum = positions.min(axis=0).tolist() if numberOfVertices else [0.0] * 3
+            maximum = positions.max(axis=0).tolist() if numberOfVertices else [0.0] * 3
+            positionData = positions.tobytes()
+            isShort = numberOfIndices == 0 or indices.max() < 0xFFFF
+            indexData = indices.astype("<u2" if isShort else "<u4").tobytes()
+            texcoords = np.asarray(uvs, dtype=np.float64).reshape(-1, 2) * [1, -1] + [0, 1]
+            numberOfTexcoords = len(texcoords)
+            texcoordData = texcoords.astype("<f4").tobytes()
+        else:
+            # Rounded to float32 so the bounds match the stored values
+            positions = array.array("f", [c for x, y, z in vertices for c in (x, z, -y)])
+            indices = [v - 1 for face in faces for v in (face[::-1] if flip_winding else face)]
+            numberOfVertices = len(positions) // 3
+            numberOfIndices = len(indices)
+            minimum = [min(positions[i::3]) for i in range(3)] if numberOfVertices else [0.0] * 3
+            maximum = [max(positions[i::3]) for i in range(3)] if numberOfVertices else [0.0] * 3
+            positionData = _packValues(positions, "f")
+            isShort = numberOfIndices == 0 or max(indices) < 0xFFFF
+            indexData = _packValues(indices, "H" if isShort else "I")
+            numberOfTexcoords = len(uvs)
+            texcoordData = _packValues([c for u, v in uvs for c in (u, 1 - v)], "f")
+
+        ARRAY_BUFFER = 34962
+        ELEMENT_ARRAY_BUFFER = 34963
+        FLOAT = 5126
+        attributes = {
+            "POSITION": self.__addAccessor(positionData, FLOAT, numberOfVertices, "VEC3",
+                                           ARRAY_BUFFER, min=minimum, max=maximum),
+        }
+        # glTF UVs have their origin at the top left, so the OBJ flip is undone
+        if numberOfTexcoords and numberOfTexcoords == numberOfVertices:
+            attributes["TEXCOORD_0"] = self.__addAccessor(texcoordData, FLOAT, numberOfTexcoords,
+                                                          "VEC2", ARRAY_BUFFER)
+        primitive = {
+            "attributes": attributes,
+            "indices": self.__addAccessor(indexData, 5123 if isShort else 5125, numberOfIndices,
+                                          "SCALAR", ELEMENT_ARRAY_BUFFER),
+        }
+        if material is not None:
+            primitive["material"] = material
+        self.__gltf["meshes"].append({"name": name, "primitives": [primitive]})
+        self.__gltf["nodes"].append({"name": name, "mesh": len(self.__gltf["meshes"]) - 1})
+        self.__gltf["scenes"][0]["nodes"].append(len(self.__gltf["nodes"]) - 1)
+
+    def write(self, filename: str):
+        gltf = dict(self.__gltf)
+        if self.__buffer:
+            gltf["buffers"] = [{"byteLength": len(self.__buffer)}]
+        jsonChunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        jsonChunk += b" " * (-len(jsonChunk) % 4)
+        binChunk = bytes(self.__buffer) + b"\x00" * (-len(self.__buffer) % 4)
+        length = 12 + 8 + len(jsonChunk) + (8 + len(binChunk) if binChunk else 0)
+        with open(filename, "wb") as f:
+            f.write(struct.pack("<4sII", b"glTF", 2, length))
+            f.write(struct.pack("<I4s", len(jsonChunk), b"JSON"))
+            f.write(jsonChunk)
+            if binChunk:
+                f.write(struct.pack("<I4s", len(binChunk), b"BIN\x00"))
+                f.write(binChunk)
+
+def exportAsGlb(ngp: NgpFile, models: list, filename: str, embedTextures: bool=True, textureStore: TextureStore=None):
+    """Write the models (from decodeModel()) to a single .glb, returning the paths written.
+
+    Textures shared by several models are only added once. If embedTextures is
+    False, they are written to .dds files next to the .glb (or taken from the
+    textureStore, if given) and referenced instead.
+    """
+    outputs = [filename]
+    scene = GlbScene()
+    materials = {}
+    for model in models:
+        modelName = os.path.basename(ngp.outputStem) + "_" + hex(model.headerOffset)
+        material = None
+        if model.textureHeaderOffset in materials:
+            material = materials[model.textureHeaderOffset]
+        elif model.textureHeaderOffset != -1:
+            if textureStore is not None:
+                textureFilename = _storedTexture(ngp, model.textureHeaderOffset, textureStore)
+                with open(textureFilename, "rb") as f:
+                    ddsdata = f.read() if embedTextures else None
+            else:
+                textureFilename = ngp.outputStem + "_" + hex(model.textureHeaderOffset) + ".dds"
+                ddsdata = rtt2dds.rtt2dds(extractNGPTexture(ngp, model.textureHeaderOffset))
+            if embedTextures:
+                material = scene.addTexture(ddsdata=ddsdata)
+            else:
+                if textureStore is None:
+                    with open(textureFilename, "wb") as f:
+                        f.write(ddsdata)
+                outputs.append(textureFilename)
+                uri = os.path.relpath(textureFilename, os.path.dirname(filename) or ".").replace(os.sep, "/")
+                material = scene.addTexture(uri=uri)
+            materials[model.textureHeaderOffset] = material
+        scene.addModel(modelName, model.vertices, model.faces, model.uvs, material, model.flip_winding)
+    with instrument.stage("glb: write"):
+        scene.write(filename)
+    return outputs
+
+# Words at +0x14 that (along with the magic) identify Type 1 and Type 2 model headers
+_MODEL_SIGNATURES = {1: 0x3C000000, 2: 0x3F800000}
+
+def _modelHeaderLength(data, loc: int, magic: int):
+    if magic == 1:
+        if loc + 0x27 > len(data):
+            return None
+        return 0x2C + (data[loc+0x26] * 0x0C)
+    return 0x48 + (_count_type2_linkers(data, loc) * 0x0C)
+
+def _findSignatures(data, start: int):
+    """Yield (offset, magic) of every header candidate at start + (n * 4)."""
+    np = optional.numpy() # Without NumPy, fall back to bytes.find() and struct
+    base = start % 4
+    if np is not None:
+        words = np.frombuffer(data, dtype=">u4", count=(len(data) - base) // 4, offset=base)
+        for magic, signature in _MODEL_SIGNATURES.items():
+            matches = np.flatnonzero((words[:-5] == magic) & (words[5:] == signature))
+            for i in (matches * 4 + base).tolist():
+                if i >= start:
+                    yield i, magic
+        return
+    for magic, signature in _MODEL_SIGNATURES.items():
+        magic_bytes = struct.pack(">I", magic)
+        signature_bytes = struct.pack(">I", signature)
+        pos = data.find(signature_bytes, start + 0x14)
+        while pos != -1:
+            i = pos - 0x14
+            if i % 4 == base and data[i:i+4] == magic_bytes:
+                yield i, magic
+            pos = data.find(signature_bytes, pos + 1)
+
+def findModelHeaders(data, start: int=0, candidates: list=None):
+    """Find all model headers in one pass over data.
+
+    Returns a sorted list of (offset, magic, header length). Like the old
+    header-by-header scan, candidates inside a previously found header are
+    skipped. candidates are the sorted signatures from start, if they have
+    already been searched for.
+    """
+    if candidates is None:
+        candidates = sorted(_findSignatures(data, start))
+    headers = []
+    end = start
+    for loc, magic in candidates:
+        if loc < end:
+            continue
+        length = _modelHeaderLength(data, loc, magic)
+        if length is None:
+            continue
+        headers.append((loc, magic, length))
+        end = loc + length
+    return headers
+
+def _modelHeadersFromTables(data):
+    """Model headers listed by Table 3, or None if its entries aren't all model headers."""
+    try:
+        table = 0x14 + struct.unpack_from(">i", data, 0x14)[0]
+        numberOfEntries, = struct.unpack_from(">H", data, table+0x2)
+        headers = []
+        for i in range(table+0x8, table+0x8+(numberOfEntries*4), 4):
+            loc = i + struct.unpack_from(">i", data, i)[0]
+            if loc < 0:
+                return None
+            magic, signature = struct.unpack_from(">I16xI", data, loc)
+            if _MODEL_SIGNATURES.get(magic) != signature:
+                return None
+            headers.append((loc, magic, _modelHeaderLength(data, loc, magic)))
+    except struct.error:
+        return None
+    if not headers or any(length is None for _, _, length in headers):
+        return None
+    return sorted(headers)
+
+def indexModelHeaders(data):
+    """Sorted (offset, magic, header length) of every model in an .ngp.
+
+    Table 3 points to T3.1 data rather than necessarily to every model, so
+    it's only trusted when it lists exactly the headers found by searching
+    for their signatures. Otherwise the search results are used.
+    """
+    with instrument.stage("ngp: find models", len(data)):
+        candidates = sorted(_findSignatures(data, 0))
+        headers = _modelHeadersFromTables(data)
+        if headers is None or [loc for loc, magic, length in headers] != [loc for loc, magic in candidates]:
+            headers = findModelHeaders(data, 0, candidates)
+    return headers
+
+def findNextModel(data: bytearray, start: int):
+    for loc, magic, length in findModelHeaders(data, start):
+        return loc, length
+    return -1, 0
+
+def _extractOne(ngp: NgpFile, loc: int, options: tuple, textureStore: TextureStore=None):
+    """Extract the model at loc, returning the paths written (or the Model if merging)."""
+    precision, outputFormat, merge, embedTextures = options
+    if outputFormat == "obj":
+        return extractModel(ngp, loc, precision, textureStore)
+    if merge:
+        return decodeModel(ngp, loc)
+    return exportAsGlb(ngp, [decodeModel(ngp, loc)], ngp.outputStem + "_" + hex(loc) + ".glb",
+                       embedTextures, textureStore)
+
+def _tryExtractOne(ngp: NgpFile, loc: int, options: tuple, textureStore: TextureStore=None):
+    """Returns (loc, result of _extractOne() or None, error message or None)."""
+    try:
+        return loc, _extractOne(ngp, loc, options, textureStore), None
+    except Exception as err:
+        return loc, None, "{}: {}".format(type(err).__name__, err)
+
+# The NgpFile (and TextureStore) of a worker process, set up once when the worker starts
+_workerNgp = None
+_workerTextureStore = None
+
+def _initWorker(filenameStem: str, textureStoreDirectory: str=None):
+    global _workerNgp, _workerTextureStore
+    _workerNgp = NgpFile(filenameStem)
+    if textureStoreDirectory is not None:
+        _workerTextureStore = TextureStore(textureStoreDirectory)
+
+def _extractWorker(job: tuple):
+    loc, options = job
+    return _tryExtractOne(_workerNgp, loc, options, _workerTextureStore)
+
+def extractModels(filename: str, precision: int=None, outputFormat: str="obj", merge: bool=False, embedTextures: bool=True, jobs: int=None, textureStore: TextureStore=None, failures: list=None):
+    """Extract every model in the .ngp, returning the paths written.
+
+    With outputFormat "obj", each model gets an .obj (plus .mtl and .dds if
+    textured). With "glb", each model gets a .glb, or if merge is set, all of
+    them go into a single <stem>.glb scene.
+
+    If jobs is given, the models are extracted by that many worker processes,
+    each with its own (read-only) mapping of the .ngp/.vram. Models that fail
+    to extract are reported at the end rather than stopping the extraction,
+    and appended to failures (as (location, error message)) if it is given.
+
+    If a textureStore is given, each unique texture is only converted and
+    written once, and the models refer to its .dds in the store.
+    """
+    filenameStem = ".".join(filename.split(".")[:-1])
+    options = (precision, outputFormat, merge, embedTextures)
+    outputs = []
+    with NgpFile(filenameStem) as ngp:
+        if os.path.dirname(ngp.outputStem):
+            # Models from a .psarc go to their path inside it
+            os.makedirs(os.path.dirname(ngp.outputStem), exist_ok=True)
+        locs = [loc for loc, magic, length in indexModelHeaders(ngp.ngp)]
+        if jobs is None:
+            results = []
+            for loc in locs:
+                print("Extracting model located at " + hex(loc))
+                with instrument.job(hex(loc)):
+                    results.append(_tryExtractOne(ngp, loc, options, textureStore))
+        else:
+            print("Extracting {} models with {} workers".format(len(locs), jobs))
+            results = []
+            textureStoreDirectory = textureStore.directory if textureStore is not None else None
+            with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_initWorker,
+                                                        initargs=(filenameStem, textureStoreDirectory)) as executor:
+                futures = [executor.submit(instrument.wrap(_extractWorker), (loc, options)) for loc in locs]
+                for future in concurrent.futures.as_completed(futures):
+                    results.append(instrument.unwrap(future.result()))
+                    print("[{}/{}] Extracted model located at {}".format(
+                        len(results), len(locs), hex(results[-1][0])))
+            results.sort(key=lambda result: result[0])
+
+        failed = [(loc, err) for loc, result, err in results if err is not None]
+        results = [result for loc, result, err in results if err is None]
+        if outputFormat == "glb" and merge:
+            if results:
+                outputs += exportAsGlb(ngp, results, ngp.outputStem + ".glb", embedTextures, textureStore)
+        else:
+            for result in results:
+                outputs += result
+
+    print("Extracted {} of {} models".format(len(locs) - len(failed), len(locs)))
+    for loc, err in failed:
+        print("    Failed {}: {}".format(hex(loc), err))
+    if failures is not None:
+        failures += failed
+    return outputs
+
+def _settings(args, filename: str, textureStore: TextureStore=None):
+    # What a manifest entry has to match to be up to date
+    return {'output': os.path.abspath(psarc.localPath(filename)), 'format': args.format,
+            'merge': args.merge, 'reference_textures': args.reference_textures, 'precision': args.precision,
+            'texture_store': os.path.abspath(textureStore.directory) if textureStore is not None else None}
+
+def _runFile(args, filename: str, records: manifest.Manifest=None, textureStore: TextureStore=None):
+    sources = [filename, ".".join(filename.split(".")[:-1]) + ".vram"]
+    def extract():
+        failures = []
+        outputs = extractModels(filename, args.precision, args.format, args.merge, not args.reference_textures, args.jobs, textureStore, failures)
+        # Not recorded in the manifest, so the failed models are retried next time
+        return outputs if not failures else None
+    if records is None:
+        extract()
+    elif records.update(records.key(filename), sources, _settings(args, filename, textureStore), extract):
+        records.save()
+    elif not args.watch:
+        print("Models from " + filename + " are up to date")
+
+def _run(args, records: manifest.Manifest=None, textureStore: TextureStore=None):
+    for filename, relpath in psarc.findFiles(args.filepath, '.ngp'):
+        try:
+            _runFile(args, filename, records, textureStore)
+        except (OSError, ValueError, struct.error) as err:
+            # One unreadable .ngp shouldn't stop the rest
+            print("Failed {}: {}: {}".format(filename, type(err).__name__, err))
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Extract models (.obj with .mtl and .dds files, or .glb) from .ngp")
+    parser.add_argument("-j", "--jobs", type=int, help="extract the models with this many worker processes")
+    parser.add_argument("--format", choices=["obj", "glb"], default="obj", help="output format for the models (default: obj)")
+    parser.add_argument("--merge", action="store_true", help="with --format glb, put every model in a single .glb scene")
+    parser.add_argument("--reference-textures", action="store_true", help="with --format glb, write the textures to .dds files instead of embedding them")
+    parser.add_argument("--texture-store", metavar="DIR", help="keep each unique texture once, as <hash>.dds in this directory, and have the models refer to it")
+    parser.add_argument("--precision", type=int, help="number of decimal places for coordinates in the .obj files (default: full precision)")
+    parser.add_argument("--manifest", help="path to a manifest file used to skip extraction when the .ngp/.vram are unchanged")
+    parser.add_argument("--watch", action="store_true", help="keep running and extract the models again when the .ngp/.vram change")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="seconds between checks for changes in watch mode")
+    parser.add_argument("filepath", nargs="+", help="path to .ngp file (make sure corresponding .vram is in the same path) or directory of .ngp files, which can be in a .psarc (archive.psarc:path/inside)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    records = None
+    if args.manifest is not None or args.watch:
+        records = manifest.Manifest(args.manifest, "ngp_models", TOOL_VERSION)
+    textureStore = None
+    if args.texture_store is not None:
+        textureStore = TextureStore(args.texture_store)
+    with instrument.session(args):
+        if args.watch:
+            manifest.watch(lambda: _run(args, records, textureStore), args.watch_interval)
+        else:
+            _run(args, records, textureStore)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import os
+import time
+import argparse
+import struct
+import concurrent.futures
+
+from . import psarc
+from . import ffutils
+from . import rtt2dds
+from . import batch
+from . import manifest
+from . import DdsHeader
+from . import instrument
+from .NgpFile import NgpFile
+
+TOOL_VERSION = 1
+
+def textureLayout(rttmod_header):
+    """The ffutils.MipLevel of each mip level of the texture with the given
+    NGP texture header, with offsets from the data location in the header.
+    """
+    if rttmod_header[0x0] not in ffutils.COMPRESSION_FOURCCS:
+        raise ValueError('Unknown compression method')
+    fourCC = ffutils.COMPRESSION_FOURCCS[rttmod_header[0x0]]
+    bits_per_pixel = 0
+    if fourCC not in ffutils.BLOCK_SIZES:
+        img_fmt, = struct.unpack(">H", rttmod_header[0x2:0x4])
+        if img_fmt not in ffutils.FORMAT_BITS:
+            raise ValueError('Unknown image format')
+        bits_per_pixel = ffutils.FORMAT_BITS[img_fmt]
+
+    width = (rttmod_header[0x4] << 8) + rttmod_header[0x5]
+    height = (rttmod_header[0x6] << 8) + rttmod_header[0x7]
+    num_mipmaps = rttmod_header[0xa]
+    depth = rttmod_header[0x9] if rttmod_header[0xb] == 0x3 else 1
+    return ffutils.get_mip_layout(width, height, num_mipmaps, fourCC, bits_per_pixel, depth)
+
+def parseNGPTextureHeader(rttmod_header, ngp_data, vram_data, verbose=True):
+    if (len(rttmod_header) != 0x10):
+        raise ValueError('rttmod_header should be size 0x10')
+    loc, = struct.unpack(">I", rttmod_header[0xc:])
+    img_data_size = ffutils.get_layout_size(textureLayout(rttmod_header))
+
+    isInNGP = rttmod_header[0x8] == 0x1
+
+    if (isInNGP):
+        if verbose:
+            print("Reading from NGP")
+        texture_data = ngp_data[loc:loc+img_data_size]
+    else:
+        if verbose:
+            print("Reading from VRAM")
+        texture_data = vram_data[loc:loc+img_data_size]
+
+    return bytearray(rttHeader(rttmod_header, img_data_size) + texture_data)
+
+def rttHeader(rttmod_header, img_data_size: int):
+    """The 0x80 byte .rtt header for the texture with the given NGP texture header."""
+    size = 0x80 + img_data_size
+    # The location flag is set to 0 to get through rtt2dds. Could change it there but idk
+    return (b'\x80' + struct.pack(">I", size - 4)[1:] + rttmod_header[:0x8] + b'\x00' +
+            rttmod_header[0x9:0xc] + ((b'\x00' * 0x10) * 7))
+
+def textureHeaders(ngp: NgpFile):
+    """Return (pointer location, header offset, header) for each texture in Table 2.
+
+    They are sorted by data location and offset rather than table order, so the
+    texture data is read through the .ngp and .vram sequentially.
+    """
+    texturePointersOffset = ngp.dereferenceRelativePointer(0x10)
+    numberOfTextures, = struct.unpack_from(">I", ngp.ngp, texturePointersOffset)
+    textures = []
+    for i in range(texturePointersOffset+4, texturePointersOffset+((numberOfTextures+1)*4), 4):
+        textureHeaderOffset = ngp.dereferenceRelativePointer(i)
+        header = bytearray(ngp.ngp[textureHeaderOffset:textureHeaderOffset+0x10])
+        textures.append((i, textureHeaderOffset, header))
+        ngp.mark(True, textureHeaderOffset, 0x10, "texture header", textureHeaderOffset)
+    ngp.mark(True, texturePointersOffset, 4 + numberOfTextures * 4, "table 2")
+    textures.sort(key=lambda texture: (texture[2][0x8:0x9], texture[2][0xc:0x10]))
+    return textures
+
+def readTexture(ngp: NgpFile, header: bytearray, verbose: bool=True):
+    """The .rtt data of the texture with the given NGP texture header."""
+    isInNGP = header[0x8] == 0x1
+    loc, = struct.unpack(">I", header[0xc:0x10])
+    with instrument.stage("ngp: read texture") as stage:
+        rttdata = parseNGPTextureHeader(header, ngp.ngp, ngp.vram, verbose)
+        stage.add(len(rttdata))
+    ngp.mark(isInNGP, loc, len(rttdata) - 0x80, "texture data")
+    return rttdata
+
+def readTextureMip(ngp: NgpFile, header: bytearray, mip: int):
+    """A single mip level of the texture with the given NGP texture header.
+
+    Only that mip level is read from the (memory-mapped) .ngp or .vram. The
+    data is as stored (eg. still swizzled for BGRA8 textures).
+    Returns (MipLevel, data).
+    """
+    layout = textureLayout(header)
+    if not 0 <= mip < len(layout):
+        raise ValueError('No mip level {} (the texture has {})'.format(mip, len(layout)))
+    level = layout[mip]
+    loc, = struct.unpack(">I", header[0xc:0x10])
+    data = ngp.data(header[0x8] == 0x1)
+    start = loc + level.offset
+    if start + level.size > len(data):
+        raise ValueError('Mip level extends past the end of the file')
+    return level, bytes(data[start:start+level.size])
+
+def extractTextures(filename: str, outdir: str=None, asDds: bool=False, verbose: bool=True):
+    """Write each texture in the .ngp to an .rtt file, returning the paths written.
+
+    The files are written to outdir (default: the current directory). If asDds
+    is set, the textures are converted and written as .dds files instead.
+    """
+    outputs = []
+    with NgpFile('.'.join(filename.split(".")[:-1])) as ngp:
+        textures = textureHeaders(ngp)
+        if verbose:
+            print("There are " + str(len(textures)) + " textures")
+        if outdir is not None:
+            os.makedirs(outdir, exist_ok=True)
+        for i, textureHeaderOffset, header in textures:
+            if verbose:
+                print("Parsing: " + str([hex(j) for j in header]))
+            data = readTexture(ngp, header, verbose)
+            out_filename = hex(i) + "_" + hex(textureHeaderOffset) + (".dds" if asDds else ".rtt")
+            if asDds:
+                data = rtt2dds.rtt2dds(data)
+            if outdir is not None:
+                out_filename = os.path.join(outdir, out_filename)
+            with instrument.stage("write", len(data)), open(out_filename, 'wb') as f:
+                f.write(data)
+            outputs.append(out_filename)
+    return outputs
+
+def _sources(filename: str):
+    return [filename, '.'.join(filename.split(".")[:-1]) + ".vram"]
+
+def _outdir(outdir: str, relpath: str):
+    # Each .ngp gets its own directory, as the texture filenames are only unique within one
+    return os.path.join(outdir, '.'.join(relpath.split(".")[:-1]))
+
+def _settings(outdir: str, asDds: bool):
+    # What a manifest entry has to match to be up to date
+    return {'outdir': os.path.abspath(outdir or '.'), 'dds': asDds}
+
+def _extract_job(job: tuple):
+    """Batch mode worker.
+
+    Returns (paths written, error message or None, manifest fingerprint).
+    """
+    filename, outdir, asDds, wantFingerprint = job
+    try:
+        sources = manifest.fingerprint(_sources(filename)) if wantFingerprint else None
+        return extractTextures(filename, outdir, asDds, verbose=False), None, sources
+    except (ValueError, OSError, struct.error) as err:
+        return [], "{}: {}".format(type(err).__name__, err), None
+
+def extractBatch(jobs: list, num_workers: int=None):
+    """Extract (filename, outdir, asDds, wantFingerprint) jobs in a process pool,
+    yielding the result of each job in order.
+
+    Each worker maps one .ngp/.vram at a time and writes every texture as it
+    goes, so memory use doesn't grow with the size of the files.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        for result in executor.map(instrument.wrap(_extract_job), jobs):
+            yield instrument.unwrap(result)
+
+def _run_batch(args, records: manifest.Manifest=None):
+    outdir = args.outdir if args.outdir is not None else '.'
+    files = [(filepath, _outdir(outdir, relpath)) for filepath, relpath in psarc.findFiles(args.filepath, '.ngp')]
+    num_files = len(files)
+    files = batch.pending(files, records, _sources, lambda ngpOutdir: _settings(ngpOutdir, args.dds), quiet=args.watch)
+    if not files:
+        return
+    jobs = [(filepath, ngpOutdir, args.dds, records is not None) for filepath, ngpOutdir in files]
+
+    extracted = 0
+    textures = 0
+    written_bytes = 0
+    failures = []
+    start = time.perf_counter()
+    for job, (outputs, err, sources) in zip(jobs, extractBatch(jobs, args.jobs)):
+        if err is not None:
+            failures.append((job[0], err))
+            continue
+        extracted += 1
+        textures += len(outputs)
+        written_bytes += sum(os.path.getsize(output) for output in outputs)
+        if records is not None:
+            records.record(records.key(job[0]), sources, outputs, _settings(job[1], job[2]))
+    batch.printSummary("Extracted {} textures from {}".format(textures, extracted), len(jobs), written_bytes,
+                       time.perf_counter() - start, num_files - len(jobs))
+    batch.printFailures(failures)
+
+    if records is not None:
+        records.save()
+
+def _run(args, records: manifest.Manifest=None):
+    isBatchMode = (args.jobs is not None or len(args.filepath) > 1
+                   or any(psarc.isDirectory(p) for p in args.filepath))
+    if isBatchMode:
+        _run_batch(args, records)
+        return
+
+    filename = args.filepath[0]
+    outdir = None
+    if args.outdir is not None:
+        outdir = _outdir(args.outdir, os.path.basename(filename))
+    def extract():
+        with instrument.job(filename):
+            return extractTextures(filename, outdir, args.dds)
+    if records is None:
+        extract()
+    elif records.update(records.key(filename), _sources(filename), _settings(outdir, args.dds), extract):
+        records.save()
+    elif not args.watch:
+        print("Textures from " + filename + " are up to date")
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Extract textures from .ngp")
+    parser.add_argument("--dds", action="store_true", help="convert the textures and write .dds files instead of .rtt files")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes for batch mode (default: number of CPUs)")
+    parser.add_argument("-o", "--outdir", help="write the textures to a directory per .ngp in here instead of the current directory")
+    parser.add_argument("--manifest", help="path to a manifest file used to skip extraction when the .ngp/.vram are unchanged")
+    parser.add_argument("--watch", action="store_true", help="keep running and extract the textures again when the .ngp/.vram change")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="seconds between checks for changes in watch mode")
+    parser.add_argument("filepath", nargs="+", help="path to .ngp file (make sure corresponding .vram is in the same path) or directory of .ngp files, which can be in a .psarc (archive.psarc:path/inside)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    records = None
+    if args.manifest is not None or args.watch:
+        records = manifest.Manifest(args.manifest, "ngp_textures", TOOL_VERSION)
+    with instrument.session(args):
+        if args.watch:
+            manifest.watch(lambda: _run(args, records), args.watch_interval)
+        else:
+            _run(args, records)
+
+if __name__ == '__main__':
+    main()
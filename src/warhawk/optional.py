@@ -0,0 +1,22 @@
+import importlib
+
+# Optional dependencies, imported the first time they're asked for.
+# Importing NumPy takes longer than converting a typical texture, so the
+# tools only do so once they have something for it to do.
+_modules = {}
+
+def module(name: str):
+    """The named module, or None if it isn't installed"""
+    try:
+        return _modules[name]
+    except KeyError:
+        pass
+    try:
+        imported = importlib.import_module(name)
+    except ImportError:
+        imported = None
+    _modules[name] = imported
+    return imported
+
+def numpy():
+    return module("numpy")
@@ -0,0 +1,302 @@
+import os
+import time
+import queue
+import struct
+import argparse
+import threading
+import collections
+import concurrent.futures
+
+from . import psarc
+from . import rtt2dds
+from . import extract_loc
+from . import instrument
+from . import ngp_models
+from . import ngp_textures
+from .NgpFile import NgpFile
+
+# A file read into memory. data is {extension: contents} (an .ngp comes with its .vram).
+Item = collections.namedtuple('Item', ['path', 'relpath', 'data', 'size'])
+
+def decodeRtt(path: str, relpath: str, data: dict):
+    """[(output path, contents)] for an .rtt: the .dds"""
+    stem = os.path.splitext(relpath)[0]
+    return [(stem + '.dds', bytes(rtt2dds.rtt2dds(bytearray(data['.rtt']))))], []
+
+def decodeLoc(path: str, relpath: str, data: dict):
+    """[(output path, contents)] for a .loc: the strings as <file>.loc.txt, as extract_loc.py writes them"""
+    extension, formatCategory = extract_loc.FORMATS['tsv']
+    text = "".join(formatCategory(category, entries) for category, entries in extract_loc.iter_loc(data['.loc']))
+    return [(relpath + extension, text.encode('utf-8', 'backslashreplace'))], []
+
+def decodeNgp(path: str, relpath: str, data: dict):
+    """[(output path, contents)] for an .ngp: a .dds per texture (in a directory
+    named after the .ngp, as ngp_textures.py names them) and an .obj per model,
+    with an .mtl referring to its texture there.
+
+    The textures are converted in memory, so their .rtt is never written.
+    Models that fail to decode are skipped and returned as errors.
+    """
+    stem = os.path.splitext(relpath)[0]
+    name = os.path.basename(stem)
+    outputs = []
+    errors = []
+    textures = {}
+    with NgpFile(os.path.splitext(path)[0], data['.ngp'], data.get('.vram')) as ngp:
+        for i, textureHeaderOffset, header in ngp_textures.textureHeaders(ngp):
+            filename = name + "/" + hex(i) + "_" + hex(textureHeaderOffset) + ".dds"
+            try:
+                rttdata = ngp_textures.readTexture(ngp, header, verbose=False)
+                outputs.append((os.path.join(os.path.dirname(stem), filename), bytes(rtt2dds.rtt2dds(rttdata))))
+                textures[textureHeaderOffset] = filename
+            except (ValueError, struct.error) as err:
+                errors.append("Texture {}: {}: {}".format(hex(textureHeaderOffset), type(err).__name__, err))
+
+        for loc, magic, length in ngp_models.indexModelHeaders(ngp.ngp):
+            modelName = name + "_" + hex(loc)
+            try:
+                model = ngp_models.decodeModel(ngp, loc)
+            except Exception as err:
+                errors.append("Model {}: {}: {}".format(hex(loc), type(err).__name__, err))
+                continue
+            textureFilename = textures.get(model.textureHeaderOffset)
+            obj = ngp_models.formatObj(modelName, model.vertices, model.faces, model.uvs,
+                                       textureFilename is not None, model.flip_winding)
+            outputs.append((stem + "_" + hex(loc) + ".obj", obj.encode('utf-8')))
+            if textureFilename is not None:
+                outputs.append((stem + "_" + hex(loc) + ".mtl", ngp_models.formatMtl(textureFilename).encode('utf-8')))
+    return outputs, errors
+
+# Decoder for each type of file, and the other files it needs (with the same stem)
+DECODERS = {
+    '.rtt': (decodeRtt, ()),
+    '.ngp': (decodeNgp, ('.vram',)),
+    '.loc': (decodeLoc, ()),
+}
+
+def _decode_job(item: Item):
+    """Returns (outputs, errors)"""
+    decode, companions = DECODERS[os.path.splitext(item.path)[1].lower()]
+    try:
+        return decode(item.path, item.relpath, item.data)
+    except Exception as err:
+        return [], ["{}: {}".format(type(err).__name__, err)]
+
+def findSources(paths: list):
+    """Yield (path, relpath) of each file with a decoder in paths, searching
+    directories and .psarc archives.
+    """
+    for filepath, relpath in psarc.findFiles(paths, tuple(DECODERS)):
+        if os.path.splitext(filepath)[1].lower() in DECODERS:
+            yield filepath, relpath
+
+class MemoryBudget:
+    '''Bytes of file data held in memory, from being read until written.
+
+    acquire() blocks while the ceiling would be exceeded, which holds the
+    reading back when decoding or writing falls behind, and handOver() does the
+    same when the outputs of a file are larger than the file. Only writing
+    frees memory without the caller's help, so a file (or outputs) larger than
+    what is left is still let through once nothing is held (or waiting to be
+    written), rather than waiting forever.
+    '''
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.writing = 0 # Of used, what has been handed over to be written
+        self.peak = 0
+        self.closed = False
+        self.__condition = threading.Condition()
+
+    def __add(self, size: int):
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        self.__condition.notify_all()
+
+    def acquire(self, size: int):
+        """Count size bytes read, once they fit. Returns False if closed meanwhile."""
+        with self.__condition:
+            while not self.closed and self.used and self.used + size > self.limit:
+                self.__condition.wait()
+            if self.closed:
+                return False
+            self.__add(size)
+            return True
+
+    def handOver(self, readSize: int, writeSize: int):
+        """Count the outputs (writeSize bytes) of a file read instead of the file
+        (readSize bytes), waiting for the outputs to fit if they're larger.
+        """
+        with self.__condition:
+            while (not self.closed and writeSize > readSize and self.writing
+                   and self.used - readSize + writeSize > self.limit):
+                self.__condition.wait()
+            self.writing += writeSize
+            self.__add(writeSize - readSize)
+
+    def release(self, size: int):
+        """Stop counting size bytes of outputs, once written"""
+        with self.__condition:
+            self.writing -= size
+            self.__add(-size)
+
+    def discard(self, size: int):
+        """Stop counting size bytes of a file read that won't be converted"""
+        with self.__condition:
+            self.__add(-size)
+
+    def close(self):
+        """Stop waiting for memory, as nothing more is going to be converted"""
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+
+def _read(path: str):
+    """{extension: contents} of the file and the companion files its decoder needs"""
+    stem, extension = os.path.splitext(path)
+    data = {extension.lower(): psarc.readFile(path)}
+    for companion in DECODERS[extension.lower()][1]:
+        try:
+            data[companion] = psarc.readFile(stem + companion)
+        except FileNotFoundError:
+            pass # Only an error if it turns out to be needed
+    return data
+
+def _readStage(sources: list, readQueue: queue.Queue, budget: MemoryBudget, failures: list, stop: threading.Event):
+    try:
+        for path, relpath in sources:
+            if stop.is_set():
+                return
+            try:
+                data = _read(path)
+            except Exception as err:
+                # Whatever goes wrong with one file, the others still get read
+                failures.append((path, "{}: {}".format(type(err).__name__, err)))
+                continue
+            size = sum(len(contents) for contents in data.values())
+            with instrument.stage("pipeline: wait for memory"):
+                if not budget.acquire(size):
+                    return
+            readQueue.put(Item(path, relpath, data, size))
+    finally:
+        # run() waits for this however reading ends
+        readQueue.put(None)
+
+def _writeStage(outdir: str, writeQueue: queue.Queue, budget: MemoryBudget, stats: dict, failures: list):
+    while True:
+        job = writeQueue.get()
+        if job is None:
+            return
+        item, outputs, errors, size = job
+        try:
+            for relpath, contents in outputs:
+                out_path = os.path.join(outdir, psarc.outputPath(relpath))
+                os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+                with instrument.stage("write", len(contents)), open(out_path, 'wb') as f:
+                    f.write(contents)
+                stats['files'] += 1
+                stats['bytes'] += len(contents)
+        except (OSError, ValueError) as err:
+            errors = errors + ["{}: {}".format(type(err).__name__, err)]
+        for err in errors:
+            failures.append((item.path, err))
+        if not errors:
+            stats['converted'] += 1
+        budget.release(size)
+
+def run(paths: list, outdir: str, num_workers: int=None, memoryLimit: int=512 << 20, queueSize: int=None):
+    """Convert every .rtt, .ngp (with its .vram) and .loc in paths, writing the
+    outputs to outdir (mirroring the directories or the archive).
+
+    Files are read, decoded (by num_workers processes) and written by separate
+    stages with bounded queues between them, so reading, converting and
+    writing overlap. File data (read but not yet written) is held up to
+    memoryLimit bytes, as MemoryBudget allows. Nothing but the final outputs
+    is written.
+    Returns (stats, failures).
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    queueSize = queueSize or 2 * num_workers
+    sources = list(findSources(paths))
+    budget = MemoryBudget(memoryLimit)
+    readQueue = queue.Queue(queueSize)
+    writeQueue = queue.Queue(queueSize)
+    stats = {'sources': len(sources), 'converted': 0, 'files': 0, 'bytes': 0, 'read': 0}
+    failures = []
+    stop = threading.Event()
+
+    reader = threading.Thread(target=_readStage, args=(sources, readQueue, budget, failures, stop))
+    writer = threading.Thread(target=_writeStage, args=(outdir, writeQueue, budget, stats, failures))
+    reader.start()
+    writer.start()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+            pending = collections.deque()
+            reading = True
+            while reading or pending:
+                if pending and (pending[0][1].done() or not reading or len(pending) >= queueSize):
+                    # Hand the results on in order, as the oldest is ready
+                    item, future = pending.popleft()
+                    outputs, errors = instrument.unwrap(future.result())
+                    size = sum(len(contents) for relpath, contents in outputs)
+                    # From here on it's the outputs that are held in memory
+                    with instrument.stage("pipeline: wait for memory"):
+                        budget.handOver(item.size, size)
+                    writeQueue.put((item, outputs, errors, size))
+                    continue
+                try:
+                    # Don't block on reading while there are results to hand on
+                    item = readQueue.get(timeout=0.05 if pending else None)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    reading = False
+                    continue
+                stats['read'] += item.size
+                pending.append((item, executor.submit(instrument.wrap(_decode_job), item)))
+    except BaseException:
+        # Eg. a broken worker pool or Ctrl-C: unblock the reader, which may be
+        # waiting for memory or for room in readQueue, before waiting for it
+        stop.set()
+        budget.close()
+        while reader.is_alive() or not readQueue.empty():
+            try:
+                item = readQueue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is not None:
+                budget.discard(item.size)
+        raise
+    finally:
+        writeQueue.put(None)
+        reader.join()
+        writer.join()
+    stats['peak'] = budget.peak
+    return stats, failures
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Convert every .rtt (to .dds), .ngp (to .dds and .obj) and .loc (to .txt) in a .psarc or directory in one go")
+    parser.add_argument("-o", "--outdir", required=True, help="directory to write the outputs to, mirroring the inputs")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes converting files (default: number of CPUs)")
+    parser.add_argument("--memory-limit", type=int, default=512, help="MiB of file data to hold in memory, files larger than that aside (default: 512)")
+    parser.add_argument("--queue-size", type=int, help="files queued between the stages (default: twice the number of workers)")
+    parser.add_argument("filepath", nargs="+", help="path to .psarc, directory or file (in a .psarc: archive.psarc:path/inside)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with instrument.session(args):
+        stats, failures = run(args.filepath, args.outdir, args.jobs, args.memory_limit << 20, args.queue_size)
+    elapsed = time.perf_counter() - start
+    mib = stats['read'] / (1024 * 1024)
+    print("Converted {} of {} files into {} files ({:.1f} MiB read in {:.2f}s, {:.1f} MiB/s, at most {:.1f} MiB held)".format(
+        stats['converted'], stats['sources'], stats['files'], mib, elapsed,
+        mib / elapsed if elapsed else 0.0, stats['peak'] / (1024 * 1024)))
+    if failures:
+        print("{} errors:".format(len(failures)))
+        for path, err in failures:
+            print("    {}: {}".format(path, err))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+import io
+import os
+import sys
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+import posixpath
+import threading
+import collections
+import concurrent.futures
+
+from . import instrument
+
+# Layout (big-endian):
+#   Header            magic, version, compression, TOC length (including the header),
+#                     TOC entry size, number of entries, block size, flags
+#   TOC entries       (MD5 of the name, first block, 40-bit size, 40-bit offset)
+#   Block sizes       compressed size of each block, 0 meaning a whole block_size
+#   Data              the blocks of each entry, one after the other
+# Entry 0 is the manifest: the names of the other entries, one per line.
+PSARC_MAGIC = b'PSAR'
+PSARC_VERSION = 0x00010004
+ARCHIVE_EXTENSION = '.psarc'
+_HEADER = struct.Struct(">4sI4sIIIII")
+_ENTRY_SIZE = 30
+FLAG_IGNORE_CASE = 0x1
+FLAG_ABSOLUTE_PATHS = 0x2
+
+Entry = collections.namedtuple('Entry', ['name', 'md5', 'first_block', 'size', 'offset'])
+
+def _blockSizeWidth(blockSize: int):
+    """Bytes used for each entry of the block size table"""
+    width = 1
+    while (1 << (8 * width)) < blockSize:
+        width += 1
+    return width
+
+class PsarcArchive:
+    '''A .psarc, memory-mapped and read without unpacking it.
+
+    Entries are decompressed a block at a time. read() decompresses all the
+    blocks of an entry across a pool of threads (zlib releases the GIL), and
+    the file-like objects from open() decompress blocks as they are reached,
+    keeping the most recently used ones in an LRU cache.
+    '''
+    path: str
+
+    def __init__(self, path: str, cacheBlocks: int=64, num_workers: int=None):
+        self.path = path
+        self.__executor = None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError("Not a .psarc: " + path)
+            self.__data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, compression, tocLength, entrySize,
+         numEntries, self.blockSize, self.flags) = _HEADER.unpack_from(self.__data, 0)
+        if magic != PSARC_MAGIC:
+            self.close()
+            raise ValueError("Not a .psarc: " + path)
+        if compression != b'zlib' or entrySize != _ENTRY_SIZE:
+            self.close()
+            raise ValueError("Unsupported .psarc ({} compression, TOC entries of {} bytes): {}".format(
+                compression.decode('latin-1'), entrySize, path))
+
+        entries = []
+        for offset in range(_HEADER.size, _HEADER.size + numEntries * _ENTRY_SIZE, _ENTRY_SIZE):
+            md5 = self.__data[offset:offset+0x10]
+            first_block, = struct.unpack_from(">I", self.__data, offset + 0x10)
+            size = int.from_bytes(self.__data[offset+0x14:offset+0x19], 'big')
+            data_offset = int.from_bytes(self.__data[offset+0x19:offset+0x1e], 'big')
+            entries.append(Entry(None, md5, first_block, size, data_offset))
+        tableStart = _HEADER.size + numEntries * _ENTRY_SIZE
+        width = _blockSizeWidth(self.blockSize)
+        table = self.__data[tableStart:tocLength]
+        self.__blockSizes = [int.from_bytes(table[i:i+width], 'big')
+                             for i in range(0, len(table) - width + 1, width)]
+
+        self.__cacheBlocks = cacheBlocks
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__num_workers = num_workers
+
+        self.__entries = {}
+        if entries:
+            names = self.__read(entries[0]).decode('utf-8').splitlines()
+            for name, entry in zip(names, entries[1:]):
+                entry = entry._replace(name=name.lstrip('/'))
+                self.__entries[self.__key(entry.name)] = entry
+
+    def __key(self, name: str):
+        name = name.replace('\\', '/').lstrip('/')
+        return name.lower() if self.flags & FLAG_IGNORE_CASE else name
+
+    def names(self):
+        return [entry.name for entry in self.__entries.values()]
+
+    def entries(self):
+        return list(self.__entries.values())
+
+    def entry(self, name: str):
+        entry = self.__entries.get(self.__key(name))
+        if entry is None:
+            raise FileNotFoundError("No such file in {}: {}".format(self.path, name))
+        return entry
+
+    def __contains__(self, name: str):
+        return self.__key(name) in self.__entries
+
+    def __blocks(self, entry: Entry):
+        """(index, offset, compressed size, size) of each block of the entry"""
+        blocks = []
+        offset = entry.offset
+        for i in range((entry.size + self.blockSize - 1) // self.blockSize):
+            size = min(self.blockSize, entry.size - i * self.blockSize)
+            compressedSize = self.__blockSizes[entry.first_block + i] or self.blockSize
+            blocks.append((entry.first_block + i, offset, compressedSize, size))
+            offset += compressedSize
+        return blocks
+
+    def __decompress(self, block: tuple):
+        index, offset, compressedSize, size = block
+        data = self.__data[offset:offset+compressedSize]
+        if compressedSize == size:
+            # Blocks that don't get smaller are stored as they are
+            return data
+        with instrument.stage("psarc: decompress", size):
+            try:
+                data = zlib.decompress(data)
+            except zlib.error as err:
+                # A ValueError, like the other ways an archive can be broken
+                raise ValueError("corrupt block {} of {}: {}".format(index, self.path, err)) from None
+        if len(data) != size:
+            raise ValueError("Block at {} decompressed to {} bytes, expecting {}".format(hex(offset), len(data), size))
+        return data
+
+    def __read(self, entry: Entry, start: int=0):
+        blocks = self.__blocks(entry)[start // self.blockSize:]
+        if len(blocks) <= 1:
+            data = b''.join(self.__decompress(block) for block in blocks)
+        else:
+            if self.__executor is None:
+                with self.__lock:
+                    if self.__executor is None:
+                        self.__executor = concurrent.futures.ThreadPoolExecutor(self.__num_workers)
+            data = b''.join(self.__executor.map(self.__decompress, blocks))
+        return data[start % self.blockSize:]
+
+    def block(self, entry: Entry, i: int):
+        """Block i of the entry, through the LRU cache"""
+        key = (entry.first_block, i)
+        with self.__lock:
+            data = self.__cache.get(key)
+            if data is not None:
+                self.__cache.move_to_end(key)
+                return data
+        data = self.__decompress(self.__blocks(entry)[i])
+        with self.__lock:
+            self.__cache[key] = data
+            while len(self.__cache) > self.__cacheBlocks:
+                self.__cache.popitem(last=False)
+        return data
+
+    def read(self, name: str, start: int=0):
+        """The contents of an entry (from start), decompressing its blocks in parallel"""
+        return self.__read(self.entry(name), start)
+
+    def readEntry(self, entry: Entry, start: int=0):
+        return self.__read(entry, start)
+
+    def open(self, name: str):
+        """A seekable, read-only file object for an entry"""
+        return PsarcFile(self, self.entry(name))
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+        self.__data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class PsarcFile(io.RawIOBase):
+    '''A file object reading an entry of a PsarcArchive a block at a time'''
+    def __init__(self, archive: PsarcArchive, entry: Entry):
+        super().__init__()
+        self.archive = archive
+        self.entry = entry
+        self.name = entry.name
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.__pos
+        elif whence == io.SEEK_END:
+            offset += self.entry.size
+        if offset < 0:
+            raise ValueError("Negative seek position {}".format(offset))
+        self.__pos = offset
+        return offset
+
+    def readinto(self, b):
+        if self.__pos >= self.entry.size:
+            return 0
+        i, start = divmod(self.__pos, self.archive.blockSize)
+        block = self.archive.block(self.entry, i)
+        n = min(len(b), len(block) - start)
+        b[:n] = block[start:start+n]
+        self.__pos += n
+        return n
+
+    def read(self, size: int=-1):
+        if size is None or size < 0:
+            return self.readall()
+        chunks = []
+        while size > 0:
+            chunk = super().read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def readall(self):
+        if self.__pos >= self.entry.size:
+            return b''
+        data = self.archive.readEntry(self.entry, self.__pos)
+        self.__pos = self.entry.size
+        return data
+
+def splitPath(path: str):
+    """Split an archive.psarc:path/inside input into (archive, path inside).
+
+    Returns (None, path) for paths that aren't in an archive. A path to the
+    .psarc itself gives an empty path inside.
+    """
+    lower = path.lower()
+    i = lower.find(ARCHIVE_EXTENSION + ':')
+    if i != -1:
+        i += len(ARCHIVE_EXTENSION)
+        return path[:i], path[i+1:]
+    if lower.endswith(ARCHIVE_EXTENSION):
+        return path, ''
+    return None, path
+
+def isArchivePath(path: str):
+    return splitPath(path)[0] is not None
+
+_archives = {}
+_archivesLock = threading.Lock()
+
+def _forgetArchives():
+    # A forked worker can't use the parent's thread pools, so it opens its own archives
+    global _archives, _archivesLock
+    _archives = {}
+    _archivesLock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forgetArchives)
+
+def openArchive(path: str):
+    """The PsarcArchive at path, opened once per process and kept open"""
+    key = os.path.abspath(path)
+    with _archivesLock:
+        archive = _archives.get(key)
+        if archive is None:
+            archive = _archives[key] = PsarcArchive(path)
+        return archive
+
+def readFile(path: str):
+    """The contents of a file, which can be in an archive (archive.psarc:path/inside)"""
+    archivePath, name = splitPath(path)
+    with instrument.stage("read") as stage:
+        if archivePath is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        else:
+            data = openArchive(archivePath).read(name)
+        stage.add(len(data))
+    return data
+
+def openFile(path: str):
+    """Open a file for reading, which can be in an archive (archive.psarc:path/inside)"""
+    archivePath, name = splitPath(path)
+    if archivePath is None:
+        return open(path, 'rb')
+    return openArchive(archivePath).open(name)
+
+def stat(path: str):
+    """(size, mtime in ns) of a file, which can be in an archive.
+
+    Files in an archive have the modification time of the archive.
+    """
+    archivePath, name = splitPath(path)
+    st = os.stat(archivePath if archivePath is not None else path)
+    if archivePath is None:
+        return st.st_size, st.st_mtime_ns
+    return openArchive(archivePath).entry(name).size, st.st_mtime_ns
+
+def isDirectory(path: str):
+    """Whether path is a directory, in an archive or not (the archive itself counts as one)"""
+    archivePath, name = splitPath(path)
+    if archivePath is None:
+        return os.path.isdir(path)
+    return name.strip('/') == '' or name not in openArchive(archivePath)
+
+def _findArchiveFiles(path: str, extension):
+    archivePath, name = splitPath(path)
+    archive = openArchive(archivePath)
+    if name in archive:
+        entryNames = [archive.entry(name).name]
+    else:
+        prefix = name.strip('/')
+        if prefix:
+            prefix += '/'
+        entryNames = [entryName for entryName in sorted(archive.names())
+                      if entryName.startswith(prefix) and entryName.lower().endswith(extension)]
+    for entryName in entryNames:
+        try:
+            relpath = outputPath(entryName)
+        except ValueError as err:
+            print("Skipping {}".format(err), file=sys.stderr)
+            continue
+        yield "{}:{}".format(archivePath, entryName), relpath
+
+def findFiles(paths: list, extension):
+    """Yield (path, relpath) of each file in paths whose name ends with extension
+    (or one of a tuple of them), searching directories and archives (or
+    directories inside them) recursively, in sorted order. Files given
+    directly are yielded whatever their extension.
+
+    relpath is relative to the directory that was given (or just the filename
+    for files given directly), or for files in an archive, the path inside it
+    as outputPath() gives it (files whose path would leave the output
+    directory are skipped). It is used to mirror the tree in an output directory.
+    """
+    for path in paths:
+        if isArchivePath(path):
+            yield from _findArchiveFiles(path, extension)
+            continue
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(extension):
+                    filepath = os.path.join(root, name)
+                    yield filepath, os.path.relpath(filepath, path)
+
+def outputPath(name: str):
+    """name (of a file in an archive) as a relative path to write its output to.
+
+    The names come from the archive itself, so ones that would end up outside
+    the output directory (eg. ../../x) raise a ValueError.
+    """
+    normalised = posixpath.normpath(name.replace('\\', '/').lstrip('/'))
+    if (normalised == '..' or normalised.startswith('../') or posixpath.isabs(normalised)
+            or os.path.isabs(normalised) or os.path.splitdrive(normalised)[0]):
+        raise ValueError("Unsafe path in archive: " + name)
+    return normalised
+
+def localPath(path: str):
+    """Where output for path goes by default: next to it, or for files in an
+    archive, at their path inside the archive (relative to the current directory).
+    """
+    archivePath, name = splitPath(path)
+    if archivePath is None:
+        return path
+    return outputPath(name)
+
+def createArchive(path: str, files: dict, blockSize: int=0x10000, compressionLevel: int=9):
+    """Write {name: contents} to a .psarc (eg. to make test archives)."""
+    names = list(files)
+    contents = ['\n'.join(names).encode('utf-8')] + [files[name] for name in names]
+    width = _blockSizeWidth(blockSize)
+    toc = []
+    blockSizes = []
+    chunks = []
+    dataOffset = 0
+    for name, data in zip([None] + names, contents):
+        md5 = hashlib.md5(name.encode('utf-8')).digest() if name is not None else b'\x00' * 0x10
+        toc.append((md5, len(blockSizes), len(data), dataOffset))
+        for start in range(0, len(data), blockSize):
+            block = data[start:start+blockSize]
+            compressed = zlib.compress(block, compressionLevel)
+            if len(compressed) >= len(block):
+                compressed = block
+            blockSizes.append(len(compressed) if len(compressed) < blockSize else 0)
+            chunks.append(compressed)
+            dataOffset += len(compressed)
+
+    tocLength = _HEADER.size + len(toc) * _ENTRY_SIZE + len(blockSizes) * width
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(PSARC_MAGIC, PSARC_VERSION, b'zlib', tocLength, _ENTRY_SIZE,
+                             len(toc), blockSize, FLAG_ABSOLUTE_PATHS))
+        for md5, first_block, size, offset in toc:
+            f.write(md5 + struct.pack(">I", first_block) + size.to_bytes(5, 'big') +
+                    (tocLength + offset).to_bytes(5, 'big'))
+        for size in blockSizes:
+            f.write(size.to_bytes(width, 'big'))
+        for chunk in chunks:
+            f.write(chunk)
+    return path
+
+def _run(args):
+    try:
+        files = list(findFiles([args.archive], ''))
+    except (OSError, ValueError) as err:
+        sys.exit("{}: {}".format(type(err).__name__, err))
+    for path, name in files:
+        if not args.extract:
+            archivePath, entryName = splitPath(path)
+            print("{:>12} {}".format(openArchive(archivePath).entry(entryName).size, name))
+            continue
+        try:
+            out_path = os.path.join(args.outdir, outputPath(name))
+            os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+            with instrument.job(name):
+                data = readFile(path)
+                with instrument.stage("write", len(data)), open(out_path, 'wb') as f:
+                    f.write(data)
+        except (OSError, ValueError) as err:
+            print("Failed {}: {}: {}".format(name, type(err).__name__, err))
+            continue
+        print("Extracted " + name)
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="List or extract the files in a .psarc")
+    parser.add_argument("-x", "--extract", action="store_true", help="extract the files instead of listing them")
+    parser.add_argument("-o", "--outdir", default=".", help="directory to extract to (default: the current directory)")
+    parser.add_argument("archive", help="path to .psarc, or archive.psarc:path/inside to only use the files there")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    if not isArchivePath(args.archive):
+        sys.exit("Not a .psarc: " + args.archive)
+    with instrument.session(args):
+        _run(args)
+
+if __name__ == '__main__':
+    main()
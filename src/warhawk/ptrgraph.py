@@ -0,0 +1,192 @@
+import os
+import mmap
+import json
+import struct
+import pickle
+import hashlib
+
+from . import optional
+from . import instrument
+
+RELATIVE = 0
+ABSOLUTE = 1
+KIND_NAMES = {RELATIVE: "R", ABSOLUTE: "A"}
+
+# Bump when the format of the cached indexes changes
+CACHE_VERSION = 1
+
+def mapFile(path: str):
+    '''Memory-map the file read-only (empty files can't be mapped, so b'' is returned for them)'''
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def readPointer(data, locOfPointer: int):
+    '''Address a relative pointer at locOfPointer points to'''
+    relativeOffset, = struct.unpack_from(">i", data, locOfPointer)
+    return locOfPointer + relativeOffset
+
+class ReverseIndex:
+    '''Every 4-byte word in the data, indexed by the address it would point to.
+
+    Each word is both a possible relative pointer (offset of the word + its
+    signed value, ignoring zeroes) and a possible absolute pointer (its unsigned
+    value). The index is built in a single pass over the data, and only keeps
+    targets below end (default: the size of the data), as those are the only
+    addresses that can be looked up.
+    '''
+    def __init__(self, data, end: int=None):
+        if end is None:
+            end = len(data)
+        self.__links = None
+        count = len(data) // 4
+        with instrument.stage("ptr: build index", len(data)):
+            if optional.numpy() is not None:
+                self.__buildArrays(data, count, end)
+            else:
+                self.__buildDict(data, count, end)
+
+    def __buildArrays(self, data, count: int, end: int):
+        np = optional.numpy()
+        words = np.frombuffer(data, dtype=">i4", count=count).astype(np.int64)
+        offsets = np.arange(0, count * 4, 4, dtype=np.int64)
+        relative = words + offsets
+        isRelative = (words != 0) & (relative >= 0) & (relative < end)
+        absolute = words & 0xFFFFFFFF
+        isAbsolute = absolute < end
+
+        targets = np.concatenate((relative[isRelative], absolute[isAbsolute]))
+        sources = np.concatenate((offsets[isRelative], offsets[isAbsolute]))
+        kinds = np.concatenate((np.full(np.count_nonzero(isRelative), RELATIVE, dtype=np.int8),
+                                np.full(np.count_nonzero(isAbsolute), ABSOLUTE, dtype=np.int8)))
+        # By target, then source, with R before A for the same source
+        order = np.lexsort((kinds, sources, targets))
+        self.__targets = targets[order]
+        self.__sources = sources[order]
+        self.__kinds = kinds[order]
+
+    def __buildDict(self, data, count: int, end: int):
+        links = {}
+        with memoryview(data) as view:
+            for i, (value,) in enumerate(struct.iter_unpack(">i", view[:count * 4])):
+                offset = i * 4
+                if value != 0 and 0 <= offset + value < end:
+                    links.setdefault(offset + value, []).append((offset, RELATIVE))
+                if value & 0xFFFFFFFF < end:
+                    links.setdefault(value & 0xFFFFFFFF, []).append((offset, ABSOLUTE))
+        self.__links = links
+
+    def linksTo(self, toOffset: int):
+        '''(offset, RELATIVE or ABSOLUTE) of each pointer to toOffset, in file order'''
+        if self.__links is not None:
+            return self.__links.get(toOffset, [])
+        np = optional.numpy()
+        lo = np.searchsorted(self.__targets, toOffset, side="left")
+        hi = np.searchsorted(self.__targets, toOffset, side="right")
+        return list(zip(self.__sources[lo:hi].tolist(), self.__kinds[lo:hi].tolist()))
+
+    def save(self, f):
+        if self.__links is not None:
+            pickle.dump(self.__links, f, protocol=pickle.HIGHEST_PROTOCOL)
+        else:
+            optional.numpy().savez(f, targets=self.__targets, sources=self.__sources, kinds=self.__kinds)
+
+    @classmethod
+    def load(cls, f):
+        '''Load an index written by save() (with the same availability of NumPy)'''
+        index = cls.__new__(cls)
+        index.__links = None
+        np = optional.numpy()
+        if np is None:
+            index.__links = pickle.load(f)
+        else:
+            arrays = np.load(f, allow_pickle=False)
+            index.__targets = arrays["targets"]
+            index.__sources = arrays["sources"]
+            index.__kinds = arrays["kinds"]
+        return index
+
+def cacheDirectory():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "warhawk-reversing")
+
+def _hashFile(path: str):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class _CacheIndex:
+    '''index.json in the cache directory, remembering the content hash of each file.
+
+    The hash is only recomputed when the size or mtime of the file changes, and
+    the cached graphs are named after it, so files with the same content share them.
+    '''
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, "index.json")
+        self.files = {}
+        self.dirty = False
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.files = data["files"]
+        except (OSError, ValueError):
+            pass
+
+    def contentHash(self, path: str):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self.files.get(path)
+        if entry is not None and (entry["size"], entry["mtime"]) == (st.st_size, st.st_mtime_ns):
+            return entry["hash"]
+        digest = _hashFile(path)
+        self.files[path] = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest}
+        self.dirty = True
+        return digest
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CACHE_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+def loadReverseIndex(path: str, data=None, useCache: bool=True):
+    '''ReverseIndex of the file, loaded from the cache if it was built before.
+
+    data is the content of the file, if it's already been read. Failing to
+    write to the cache isn't an error, the index just gets built again next time.
+    '''
+    if data is None:
+        data = mapFile(path)
+    if not useCache:
+        return ReverseIndex(data)
+
+    directory = cacheDirectory()
+    cacheIndex = _CacheIndex(directory)
+    with instrument.stage("ptr: hash file", len(data)):
+        digest = cacheIndex.contentHash(path)
+    cachePath = os.path.join(directory, digest + (".npz" if optional.numpy() is not None else ".pickle"))
+    try:
+        with instrument.stage("ptr: load cached index"), open(cachePath, "rb") as f:
+            index = ReverseIndex.load(f)
+    except (OSError, ValueError, EOFError, KeyError, pickle.UnpicklingError):
+        index = None
+
+    try:
+        if index is None:
+            index = ReverseIndex(data)
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(cachePath, os.getpid())
+            with open(tmp_path, "wb") as f:
+                index.save(f)
+            os.replace(tmp_path, cachePath)
+        cacheIndex.save()
+    except OSError:
+        pass
+    return index
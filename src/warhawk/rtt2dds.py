@@ -0,0 +1,438 @@
+import os
+import mmap
+import time
+import struct
+import argparse
+import functools
+import concurrent.futures
+
+from . import psarc
+from . import ffutils
+from . import batch
+from . import manifest
+from . import DdsHeader
+from . import optional
+from . import instrument
+
+TOOL_VERSION = 1
+
+def _deinterleave_bits(n):
+    n &= 0x55555555
+    n = (n | (n >> 1)) & 0x33333333
+    n = (n | (n >> 2)) & 0x0f0f0f0f
+    n = (n | (n >> 4)) & 0x00ff00ff
+    n = (n | (n >> 8)) & 0x0000ffff
+    return n
+
+def _deswizzle_mip(data, width, height):
+    """Convert Morton-order (swizzled) pixel data to linear raster order."""
+    out = bytearray(width * height * 4)
+    for i in range(width * height):
+        px = _deinterleave_bits(i)
+        py = _deinterleave_bits(i >> 1)
+        src = i * 4
+        dst = (py * width + px) * 4
+        out[dst:dst+4] = data[src:src+4]
+    return out
+
+@functools.lru_cache(maxsize=32)
+def _morton_gather_index(width, height):
+    """Source pixel index for each linear pixel of a Morton-swizzled image.
+
+    Returns None when the Morton order does not map onto the image one-to-one
+    (eg. some non-square sizes), in which case the pure-Python path is used.
+    """
+    count = width * height
+    if count == 0:
+        return None
+    np = optional.numpy()
+    i = np.arange(count, dtype=np.uint32)
+    px = _deinterleave_bits(i.copy()) # Works in place on its argument
+    py = _deinterleave_bits(i >> 1)
+    dst = py.astype(np.int64) * width + px
+    if dst.max() >= count or np.bincount(dst, minlength=count).max() != 1:
+        return None
+    index = np.empty(count, dtype=np.intp)
+    index[dst] = np.arange(count, dtype=np.intp)
+    index.setflags(write=False) # Shared between calls via the cache
+    return index
+
+def deswizzleAndFlipSlice(data, width, height):
+    """Deswizzle and vertically flip a single 2D slice of BGRA8 pixel data."""
+    index = None
+    np = optional.numpy() # Without NumPy, fall back to the pure-Python deswizzle
+    if np is not None and len(data) == width * height * 4:
+        index = _morton_gather_index(width, height)
+    if index is None:
+        deswizzled = _deswizzle_mip(data, width, height)
+        rows = [deswizzled[r*width*4:(r+1)*width*4] for r in range(height)]
+        return b''.join(reversed(rows))
+    pixels = np.frombuffer(data, dtype=np.uint32)
+    return pixels[index].reshape(height, width)[::-1].tobytes()
+
+def _deswizzle_and_flip(pixel_data, width, height, num_mipmaps, depth=1):
+    """Deswizzle and vertically flip all mipmap levels.
+
+    For volume textures (depth > 1), each mip level is stored as depth sequential
+    2D-swizzled slices.
+    """
+    result = bytearray()
+    with instrument.stage("rtt: deswizzle", len(pixel_data)):
+        for level in ffutils.get_mip_layout(width, height, num_mipmaps, None, 32, depth):
+            for i in range(level.depth):
+                start = level.slice_offset(i)
+                result += deswizzleAndFlipSlice(pixel_data[start:start+level.slice_size],
+                                                level.width, level.height)
+    return result
+
+def mipLayout(dds_header, depth: int):
+    """The ffutils.MipLevel of each mip level, with offsets from the start of the payload (0x80)."""
+    return ffutils.get_mip_layout(dds_header.width, dds_header.height, dds_header.num_mipmaps,
+                                  dds_header.fourCC, dds_header.RGBBitCount, depth)
+
+def parseRttHeader(data, isPermissiveMode: bool=False, fileSize: int=None):
+    """Validate an .rtt and build the matching DDS header.
+
+    Only the first 0x80 bytes and the length of data are looked at, so data can
+    be any buffer (eg. a memoryview of a memory-mapped file). If fileSize is
+    given, it is used instead of the length of data, so data only needs to
+    hold the header.
+    Returns (dds_header, img_fmt, depth).
+    """
+    if fileSize is None:
+        fileSize = len(data)
+    if len(data) < 0x10 or fileSize < 0x80:
+        # Not even permissive mode can make anything of it
+        raise ValueError('File is too small to be an .rtt')
+    dds_header = DdsHeader.DdsHeader()
+
+    # Default values
+    dds_header.hasAlpha    = False # TODO: why False?
+    dds_header.isPitch     = False # TODO: why False?
+    dds_header.hasDepth    = False # TODO: why False?
+    dds_header.isComplex   = False # TODO: why False?
+
+    # "Used in some older DDS files..."
+    # Let's just ignore for now
+    dds_header.hasAlphaOnly = False # TODO: why False?
+    dds_header.isYUV        = False # TODO: why False?
+    dds_header.isLUM        = False # TODO: why False?
+
+    dds_header.depth       = 1
+    dds_header.RGBBitCount = 0
+    dds_header.RBitMask    = 0
+    dds_header.GBitMask    = 0
+    dds_header.BBitMask    = 0
+    dds_header.ABitMask    = 0
+
+    # Magic
+    if data[0x0] != 0x80:
+        msg = 'Expecting 0x80 at pos 0x00'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    # File size (+4 since points to start of last DWORD)
+    filesize = (struct.unpack(">I", data[:0x4])[0] & 0x00FFFFFF) + 4
+    if fileSize != filesize:
+        msg = 'Filesize does not match header'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    # Find compression method
+    if data[0x4] in ffutils.COMPRESSION_FOURCCS:
+        dds_header.fourCC = ffutils.COMPRESSION_FOURCCS[data[0x4]]
+    else:
+        msg = 'Unknown compression method'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    if data[0x5] != 0x0:
+        msg = 'Expecting 0x00 at pos 0x05'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    # Get image format
+    img_fmt = struct.unpack(">H", data[0x6:0x8])[0]
+    if img_fmt == 0xAAE4:
+        pass # Already set above
+    elif img_fmt == 0xA9FF:
+        # Boundary Mask
+        dds_header.hasAlpha     = True
+        dds_header.hasAlphaOnly = True
+        dds_header.RGBBitCount  = 8
+        dds_header.ABitMask     = 0xFF
+    elif img_fmt == 0xAA1B:
+        # BGRA8 uncompressed, Morton-swizzled. Bytes per pixel: [B, G, R, A].
+        dds_header.hasAlpha    = True
+        dds_header.RGBBitCount = 32
+        dds_header.RBitMask    = 0x00FF0000
+        dds_header.GBitMask    = 0x0000FF00
+        dds_header.BBitMask    = 0x000000FF
+        dds_header.ABitMask    = 0xFF000000
+    else:
+        msg = 'Unknown image format'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    # Get resolution
+    dds_header.width = struct.unpack(">H", data[0x8:0xa])[0]
+    dds_header.height = struct.unpack(">H", data[0xa:0xc])[0]
+
+    if data[0xc] != 0x0:
+        msg = 'Expecting 0x0 at pos 0x0C'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    num_dimensions = data[0xf]
+    depth = data[0xd]
+    dds_header.num_mipmaps = data[0xe]
+    if num_dimensions == 0x3:
+        dds_header.hasDepth  = True
+        dds_header.isComplex = True
+        dds_header.depth     = depth
+    else:
+        dds_header.hasDepth = False
+        dds_header.depth    = 1
+        depth               = 1
+
+    if fileSize - 0x80 != ffutils.get_layout_size(mipLayout(dds_header, depth)):
+        msg = 'Mipmap number to filesize mismatch'
+        if isPermissiveMode:
+            print(" - " + msg, end="")
+        else:
+            raise ValueError(msg)
+
+    return dds_header, img_fmt, depth
+
+def rtt2dds(data: bytearray, isPermissiveMode: bool=False):
+    with instrument.stage("rtt: validate header"):
+        dds_header, img_fmt, depth = parseRttHeader(data, isPermissiveMode)
+    with instrument.stage("dds: create header"):
+        dds_header_bytes = dds_header.create()
+
+    if img_fmt == 0xAA1B:
+        pixel_data = _deswizzle_and_flip(data[0x80:], dds_header.width,
+                                         dds_header.height, dds_header.num_mipmaps,
+                                         depth)
+        data = bytearray(dds_header_bytes) + pixel_data
+    else:
+        for i in range(len(dds_header_bytes)):
+            data[i] = dds_header_bytes[i]
+
+    return data
+
+def readRttMip(path: str, mip: int, isPermissiveMode: bool=False):
+    """Read a single mip level of an .rtt file.
+
+    The file is memory-mapped, so only the header and that mip level are read.
+    The data is as stored in the .rtt (eg. still swizzled for BGRA8 textures).
+    Returns (dds_header, img_fmt, MipLevel, data).
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 0x80:
+            raise ValueError('File is too small to be an .rtt')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                dds_header, img_fmt, depth = parseRttHeader(view, isPermissiveMode)
+                layout = mipLayout(dds_header, depth)
+                if not 0 <= mip < len(layout):
+                    raise ValueError('No mip level {} (the texture has {})'.format(mip, len(layout)))
+                level = layout[mip]
+                start = 0x80 + level.offset
+                if start + level.size > len(view):
+                    raise ValueError('Mip level extends past the end of the file')
+                data = bytes(view[start:start+level.size])
+    return dds_header, img_fmt, level, data
+
+def _write_buffers(path: str, buffers: list):
+    """Write the buffers to path, using a single gather write where possible."""
+    with instrument.stage("write", sum(len(buffer) for buffer in buffers)):
+        _writev(path, buffers)
+
+def _writev(path: str, buffers: list):
+    if not hasattr(os, 'writev'):
+        with open(path, 'wb') as f:
+            for buffer in buffers:
+                f.write(buffer)
+        return
+    views = [memoryview(buffer) for buffer in buffers]
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        while views:
+            written = os.writev(fd, views)
+            while views and written >= views[0].nbytes:
+                written -= views.pop(0).nbytes
+            if written:
+                views[0] = views[0][written:]
+    finally:
+        os.close(fd)
+
+def convertFile(in_path: str, out_path: str, isPermissiveMode: bool=False):
+    """Convert an .rtt file to a .dds file without copying the payload.
+
+    The .rtt is memory-mapped, and unless it has to be deswizzled, the DDS
+    header and the untouched payload are written straight from the mapping.
+    Returns the size of the .rtt file.
+    """
+    with open(in_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 0x80:
+            # Nothing worth mapping, let rtt2dds() deal with it
+            ddsdata = rtt2dds(bytearray(f.read()), isPermissiveMode)
+            _write_buffers(out_path, [ddsdata])
+            return size
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                with instrument.stage("rtt: validate header"):
+                    dds_header, img_fmt, depth = parseRttHeader(view, isPermissiveMode)
+                with instrument.stage("dds: create header"):
+                    dds_header_bytes = dds_header.create()
+                if img_fmt == 0xAA1B:
+                    payload = _deswizzle_and_flip(view[0x80:], dds_header.width,
+                                                  dds_header.height,
+                                                  dds_header.num_mipmaps, depth)
+                    _write_buffers(out_path, [dds_header_bytes, payload])
+                else:
+                    with view[0x80:] as payload:
+                        _write_buffers(out_path, [dds_header_bytes, payload])
+    return size
+
+def _dds_path(filepath: str, relpath: str, outdir: str=None):
+    out_filename = '.'.join(os.path.basename(filepath).split('.')[:-1]) + '.dds'
+    if outdir is None and psarc.isArchivePath(filepath):
+        outdir = '.' # Mirror the archive in the current directory
+    if outdir is None:
+        return os.path.join(os.path.dirname(filepath), out_filename)
+    return os.path.join(outdir, os.path.dirname(relpath), out_filename)
+
+def _convert(filepath: str, out_path: str, isPermissiveMode: bool, useMmap: bool):
+    """Convert a single file, returning the size of the .rtt."""
+    if psarc.isArchivePath(filepath):
+        rttdata = bytearray(psarc.readFile(filepath))
+        _write_buffers(out_path, [rtt2dds(rttdata, isPermissiveMode)])
+        return len(rttdata)
+    if useMmap:
+        return convertFile(filepath, out_path, isPermissiveMode)
+    with instrument.stage("read") as stage, open(filepath, 'rb') as f:
+        rttdata = bytearray(f.read())
+        stage.add(len(rttdata))
+    size = len(rttdata)
+    ddsdata = rtt2dds(rttdata, isPermissiveMode)
+    _write_buffers(out_path, [ddsdata])
+    return size
+
+def _convert_job(job: tuple):
+    """Batch mode worker.
+
+    Returns (size of the .rtt, error message or None, manifest fingerprint).
+    """
+    filepath, out_path, isPermissiveMode, useMmap, wantFingerprint = job
+    try:
+        sources = manifest.fingerprint([filepath]) if wantFingerprint else None
+        os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+        return _convert(filepath, out_path, isPermissiveMode, useMmap), None, sources
+    except (ValueError, OSError, struct.error) as err:
+        return 0, "{}: {}".format(type(err).__name__, err), None
+
+def convertBatch(jobs: list, num_workers: int=None, chunksize: int=None):
+    """Convert (filepath, out_path, isPermissiveMode, useMmap, wantFingerprint) jobs
+    in a process pool, yielding the result of each job in order.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    if chunksize is None:
+        # A few chunks per worker keeps them busy without much IPC overhead
+        chunksize = max(1, len(jobs) // (num_workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        for result in executor.map(instrument.wrap(_convert_job), jobs, chunksize=chunksize):
+            yield instrument.unwrap(result)
+
+def _settings(out_path: str):
+    # What a manifest entry has to match to be up to date
+    return {'output': os.path.abspath(out_path)}
+
+def _run(args, records: manifest.Manifest=None):
+    files = [(filepath, _dds_path(filepath, relpath, args.outdir))
+             for filepath, relpath in psarc.findFiles(args.filepath, '.rtt')]
+    num_files = len(files)
+    files = batch.pending(files, records, lambda filepath: [filepath], _settings, quiet=args.watch)
+    if not files:
+        return
+    jobs = [(filepath, out_path, args.permissive, not args.no_mmap, records is not None)
+            for filepath, out_path in files]
+
+    isBatchMode = args.jobs is not None or any(psarc.isDirectory(p) for p in args.filepath)
+    if isBatchMode:
+        converted = 0
+        converted_bytes = 0
+        failures = []
+        start = time.perf_counter()
+        for job, (size, err, sources) in zip(jobs, convertBatch(jobs, args.jobs, args.chunksize)):
+            if err is not None:
+                failures.append((job[0], err))
+                continue
+            converted += 1
+            converted_bytes += size
+            if records is not None:
+                records.record(records.key(job[0]), sources, [job[1]], _settings(job[1]))
+        batch.printSummary("Converted {}".format(converted), len(jobs), converted_bytes,
+                           time.perf_counter() - start, num_files - len(jobs))
+        batch.printFailures(failures, byMessage=True)
+    else:
+        for job in jobs:
+            filepath, out_path = job[:2]
+            print("Processing " + filepath, end="")
+            try:
+                sources = manifest.fingerprint([filepath]) if records is not None else None
+                if args.outdir is not None or psarc.isArchivePath(filepath):
+                    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+                with instrument.job(filepath):
+                    _convert(filepath, out_path, args.permissive, not args.no_mmap)
+                if records is not None:
+                    records.record(records.key(filepath), sources, [out_path], _settings(out_path))
+                print(" - Done")
+            except (ValueError, OSError, struct.error) as err:
+                print(' - {}: {}'.format(type(err).__name__, err))
+
+    if records is not None:
+        records.save()
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Convert .rtt files to .dds files")
+    parser.add_argument("--permissive", action="store_true", help="run in permissve mode (don't throw on unexpected values)")
+    parser.add_argument("--no-mmap", action="store_true", help="read each file into memory instead of memory-mapping it")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes for batch mode (default: number of CPUs)")
+    parser.add_argument("--chunksize", type=int, help="number of files handed to a worker at a time in batch mode")
+    parser.add_argument("-o", "--outdir", help="write the .dds files here (mirroring the input directories) instead of next to the .rtt files")
+    parser.add_argument("--manifest", help="path to a manifest file used to skip files that are already converted")
+    parser.add_argument("--watch", action="store_true", help="keep running and convert files again when they change")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="seconds between checks for changes in watch mode")
+    parser.add_argument("filepath", nargs="+", help="path to .rtt file or directory of .rtt files, which can be in a .psarc (archive.psarc:path/inside)")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+    if args.permissive:
+        print("Running in permissive mode")
+
+    records = None
+    if args.manifest is not None or args.watch:
+        records = manifest.Manifest(args.manifest, "rtt2dds", TOOL_VERSION)
+    with instrument.session(args):
+        if args.watch:
+            manifest.watch(lambda: _run(args, records), args.watch_interval)
+        else:
+            _run(args, records)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import collections
+import concurrent.futures
+
+from . import psarc
+from . import ffutils
+from . import rtt2dds
+from . import instrument
+from . import ngp_textures
+from .NgpFile import NgpFile
+
+RTT_HEADER_SIZE = 0x80
+# The texture location (0xC-0xF) of NGP texture headers is left out of the statistics
+NGP_HEADER_SIZE = 0xC
+
+# Names used for the bytes in the Header Statistics of docs/RTT.md
+RTT_BYTE_NAMES = {0x0: "MAGI", 0x1: "LEN0", 0x2: "LEN1", 0x3: "LEN2", 0x4: "COMP",
+                  0x6: "FMT0", 0x7: "FMT1", 0x8: "WDT0", 0x9: "WDT1",
+                  0xa: "HGT0", 0xb: "HGT1", 0xe: "MIPS"}
+# An NGP texture header is bytes 0x4-0xF of an .rtt header, followed by the texture location
+NGP_BYTE_NAMES = {0x0: "COMP", 0x2: "FMT0", 0x3: "FMT1", 0x4: "WDT0", 0x5: "WDT1",
+                  0x6: "HGT0", 0x7: "HGT1", 0x8: "LOCF", 0xa: "MIPS"}
+
+def _rejection(header: bytes, fileSize: int):
+    """Why rtt2dds would reject an .rtt with this header and size, or None"""
+    if len(header) < 0x10:
+        return "File is too small to be an .rtt"
+    try:
+        rtt2dds.parseRttHeader(header, fileSize=fileSize)
+    except (ValueError, struct.error) as err:
+        return str(err)
+    return None
+
+def scanRtt(filepath: str):
+    """Read only the header of an .rtt.
+
+    Returns (header, file size, why rtt2dds would reject it or None).
+    """
+    size, mtime = psarc.stat(filepath)
+    with instrument.stage("read", RTT_HEADER_SIZE), psarc.openFile(filepath) as f:
+        header = f.read(RTT_HEADER_SIZE)
+    with instrument.stage("rtt: validate header"):
+        reason = _rejection(header, size)
+    return header, size, reason
+
+def scanNgp(filepath: str):
+    """Read only the texture headers of an .ngp.
+
+    Returns a list of (header offset, header, why rtt2dds would reject the
+    texture or None). The .ngp and .vram are memory-mapped, so none of the
+    texture data is read.
+    """
+    textures = []
+    with NgpFile('.'.join(filepath.split(".")[:-1])) as ngp:
+        for i, textureHeaderOffset, header in ngp_textures.textureHeaders(ngp):
+            header = bytes(header)
+            try:
+                layout = ngp_textures.textureLayout(header)
+                img_data_size = ffutils.get_layout_size(layout)
+                reason = _rejection(ngp_textures.rttHeader(header, img_data_size), 0x80 + img_data_size)
+                loc, = struct.unpack(">I", header[0xc:0x10])
+                if reason is None and loc + img_data_size > len(ngp.data(header[0x8] == 0x1)):
+                    reason = "Texture data extends past the end of the " + (".ngp" if header[0x8] == 0x1 else ".vram")
+            except (OSError, ValueError) as err:
+                reason = str(err)
+            textures.append((textureHeaderOffset, header, reason))
+    return textures
+
+def _scan_job(filepath: str):
+    """Returns ('rtt', (header, size, reason)), ('ngp', textures) or (kind, None, error)"""
+    kind = os.path.splitext(filepath)[1].lower()[1:]
+    try:
+        if kind == 'ngp':
+            return kind, scanNgp(filepath), None
+        return kind, scanRtt(filepath), None
+    except (OSError, ValueError, struct.error) as err:
+        return kind, None, "{}: {}".format(type(err).__name__, err)
+
+def _describeFormat(header: bytes, offset: int):
+    """'DXT1 0xaae4' style name of the compression and image format at offset in the header"""
+    fourCC = ffutils.COMPRESSION_FOURCCS.get(header[offset])
+    if fourCC in ffutils.BLOCK_SIZES:
+        compression = fourCC.decode('ascii')
+    elif fourCC is not None:
+        compression = "uncompressed"
+    else:
+        compression = "compression " + hex(header[offset])
+    img_fmt, = struct.unpack_from(">H", header, offset + 0x2)
+    return "{} {}".format(compression, hex(img_fmt))
+
+def _describeDimensions(header: bytes, offset: int):
+    width, height = struct.unpack_from(">HH", header, offset + 0x4)
+    if header[offset + 0xb] == 0x3:
+        return "{}x{}x{}".format(width, height, header[offset + 0x9])
+    return "{}x{}".format(width, height)
+
+class Inventory:
+    '''Histograms and breakdowns of the headers seen by the scanner'''
+    def __init__(self, headerSize: int):
+        self.count = 0
+        self.bytes = [collections.Counter() for i in range(headerSize)]
+        self.formats = collections.Counter()
+        self.dimensions = collections.Counter()
+        self.mipmaps = collections.Counter()
+        self.rejects = []
+
+    def add(self, header: bytes, name: str, reason: str, offset: int):
+        """Count a header, where offset is where the compression byte is in it"""
+        self.count += 1
+        for i, value in enumerate(header[:len(self.bytes)]):
+            self.bytes[i][value] += 1
+        if len(header) >= offset + 0xc:
+            self.formats[_describeFormat(header, offset)] += 1
+            self.dimensions[_describeDimensions(header, offset)] += 1
+            self.mipmaps[header[offset + 0xa]] += 1
+        if reason is not None:
+            self.rejects.append((name, reason))
+
+    def histogram(self, names: dict):
+        """Lines of per-byte value counts, as in the Header Statistics of docs/RTT.md"""
+        for i, counts in enumerate(self.bytes):
+            if counts:
+                yield "{}: {}".format(names.get(i, "0x{:02x}".format(i)),
+                                      " ".join("{}({})".format(hex(value), count) for value, count in sorted(counts.items())))
+
+    def toJson(self, names: dict):
+        return {
+            "count": self.count,
+            "bytes": {names.get(i, "0x{:02x}".format(i)): {hex(value): count for value, count in sorted(counts.items())}
+                      for i, counts in enumerate(self.bytes) if counts},
+            "formats": dict(self.formats.most_common()),
+            "dimensions": dict(self.dimensions.most_common()),
+            "mipmaps": {str(mips): count for mips, count in sorted(self.mipmaps.items())},
+            "rejects": [{"file": name, "reason": reason} for name, reason in self.rejects],
+        }
+
+def scan(paths: list, num_workers: int=None):
+    """Scan the .rtt and .ngp files in paths with a pool of threads.
+
+    Returns (rtt Inventory, ngp texture header Inventory, files scanned, errors),
+    where errors lists (file, message) for files that couldn't be read at all.
+    """
+    rtts = Inventory(RTT_HEADER_SIZE)
+    ngps = Inventory(NGP_HEADER_SIZE)
+    files = [filepath for filepath, relpath in psarc.findFiles(paths, ('.rtt', '.ngp'))]
+    errors = []
+    # Reading a header is mostly waiting on the disk, so threads are enough
+    with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+        for filepath, (kind, result, err) in zip(files, executor.map(instrument.timed(_scan_job), files)):
+            if err is not None:
+                errors.append((filepath, err))
+            elif kind == 'ngp':
+                for textureHeaderOffset, header, reason in result:
+                    ngps.add(header, "{}@{}".format(filepath, hex(textureHeaderOffset)), reason, 0x0)
+            else:
+                header, size, reason = result
+                rtts.add(header, filepath, reason, 0x4)
+    return rtts, ngps, len(files), errors
+
+def _printBreakdown(title: str, counts: collections.Counter):
+    print(title + ":")
+    for value, count in counts:
+        print("    {}: {}".format(value, count))
+
+def _printInventory(title: str, inventory: Inventory, names: dict):
+    print()
+    print("## " + title)
+    print()
+    for line in inventory.histogram(names):
+        print(line)
+    print()
+    _printBreakdown("Formats", inventory.formats.most_common())
+    _printBreakdown("Dimensions", inventory.dimensions.most_common())
+    _printBreakdown("Mipmaps", sorted(inventory.mipmaps.items()))
+    print("Rejected by rtt2dds: {}".format(len(inventory.rejects)))
+    for name, reason in inventory.rejects:
+        print("    {}: {}".format(name, reason))
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Collect statistics on the headers of .rtt files and the textures in .ngp files, without reading any pixel data")
+    parser.add_argument("-j", "--jobs", type=int, help="number of threads reading headers")
+    parser.add_argument("--json", action="store_true", help="write the statistics as JSON")
+    parser.add_argument("filepath", nargs="+", help="path to .rtt or .ngp file or directory to search for them")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with instrument.session(args):
+        rtts, ngps, num_files, errors = scan(args.filepath, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        json.dump({"rtt": rtts.toJson(RTT_BYTE_NAMES), "ngp": ngps.toJson(NGP_BYTE_NAMES),
+                   "errors": [{"file": name, "error": err} for name, err in errors]},
+                  sys.stdout, indent=1)
+        print()
+        return
+
+    print("Scanned {} files in {:.2f}s: {} .rtt headers, {} .ngp texture headers".format(
+        num_files, elapsed, rtts.count, ngps.count))
+    if rtts.count:
+        _printInventory(".rtt headers", rtts, RTT_BYTE_NAMES)
+    if ngps.count:
+        _printInventory(".ngp texture headers", ngps, NGP_BYTE_NAMES)
+    if errors:
+        print()
+        print("Failed to read {} files:".format(len(errors)))
+        for name, err in errors:
+            print("    {}: {}".format(name, err))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+import os
+import sys
+import mmap
+import zlib
+import struct
+import argparse
+import concurrent.futures
+
+from . import psarc
+from . import ffutils
+from . import rtt2dds
+from . import batch
+from . import instrument
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # Decoding needs NumPy, see main()
+
+def _expand565(colours):
+    """RGB565 values to an array of 8-bit [R, G, B] (as uint16, for blending)"""
+    r = (colours >> 11) & 0x1F
+    g = (colours >> 5) & 0x3F
+    b = colours & 0x1F
+    return np.stack(((r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)), axis=-1)
+
+def _colourBlocks(c0, c1, bits, hasPunchThrough: bool):
+    """RGBA pixels (blocks x 16 x 4) of the colour part of BC1/2/3 blocks"""
+    rgb0 = _expand565(c0.astype(np.uint16))
+    rgb1 = _expand565(c1.astype(np.uint16))
+    fourColours = (c0 > c1)[:, None]
+    if not hasPunchThrough:
+        # DXT3/5 always use the four colour mode
+        fourColours = np.ones_like(fourColours)
+    palette = np.empty((len(c0), 4, 4), dtype=np.uint16)
+    palette[:, 0, :3] = rgb0
+    palette[:, 1, :3] = rgb1
+    palette[:, 2, :3] = np.where(fourColours, (2 * rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palette[:, 3, :3] = np.where(fourColours, (rgb0 + 2 * rgb1) // 3, 0)
+    palette[:, :, 3] = 255
+    palette[:, 3, 3] = np.where(fourColours[:, 0], 255, 0)
+    indices = (bits.astype(np.uint32)[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 0x3
+    return palette[np.arange(len(c0))[:, None], indices].astype(np.uint8)
+
+def _unblock(pixels, width: int, height: int):
+    """Arrange (blocks x 16 x 4) pixels, in row-major block order, into an image."""
+    blocks_w = max(1, (width + 3) // 4)
+    blocks_h = max(1, (height + 3) // 4)
+    image = pixels.reshape(blocks_h, blocks_w, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    return image.reshape(blocks_h * 4, blocks_w * 4, 4)[:height, :width]
+
+_BC1_BLOCK = None
+_BC2_BLOCK = None
+_BC3_BLOCK = None
+
+def _blockTypes():
+    global _BC1_BLOCK, _BC2_BLOCK, _BC3_BLOCK
+    if _BC1_BLOCK is None:
+        colour = [('c0', '<u2'), ('c1', '<u2'), ('bits', '<u4')]
+        _BC1_BLOCK = np.dtype(colour)
+        _BC2_BLOCK = np.dtype([('alpha', '<u8')] + colour)
+        _BC3_BLOCK = np.dtype([('a0', 'u1'), ('a1', 'u1'), ('alphaBits', 'u1', 6)] + colour)
+
+def decodeBC1(data, width: int, height: int):
+    """Decode a DXT1 (BC1) image to a height x width x 4 RGBA array."""
+    _blockTypes()
+    count = max(1, (width + 3) // 4) * max(1, (height + 3) // 4)
+    blocks = np.frombuffer(data, dtype=_BC1_BLOCK, count=count)
+    pixels = _colourBlocks(blocks['c0'], blocks['c1'], blocks['bits'], True)
+    return _unblock(pixels, width, height)
+
+def decodeBC2(data, width: int, height: int):
+    """Decode a DXT3 (BC2) image to a height x width x 4 RGBA array."""
+    _blockTypes()
+    count = max(1, (width + 3) // 4) * max(1, (height + 3) // 4)
+    blocks = np.frombuffer(data, dtype=_BC2_BLOCK, count=count)
+    pixels = _colourBlocks(blocks['c0'], blocks['c1'], blocks['bits'], False)
+    alpha = (blocks['alpha'][:, None] >> (4 * np.arange(16, dtype=np.uint64))) & 0xF
+    pixels[:, :, 3] = alpha.astype(np.uint8) * 17
+    return _unblock(pixels, width, height)
+
+def decodeBC3(data, width: int, height: int):
+    """Decode a DXT5 (BC3) image to a height x width x 4 RGBA array."""
+    _blockTypes()
+    count = max(1, (width + 3) // 4) * max(1, (height + 3) // 4)
+    blocks = np.frombuffer(data, dtype=_BC3_BLOCK, count=count)
+    pixels = _colourBlocks(blocks['c0'], blocks['c1'], blocks['bits'], False)
+
+    a0 = blocks['a0'].astype(np.uint16)[:, None]
+    a1 = blocks['a1'].astype(np.uint16)[:, None]
+    eightAlphas = a0 > a1
+    steps = np.arange(1, 7, dtype=np.uint16)
+    palette = np.empty((count, 8), dtype=np.uint16)
+    palette[:, 0:1] = a0
+    palette[:, 1:2] = a1
+    # a0 > a1: six values interpolated between them
+    # otherwise: four interpolated values, then 0 and 255
+    palette[:, 2:8] = np.where(eightAlphas, ((7 - steps) * a0 + steps * a1) // 7, 0)
+    fourSteps = np.arange(1, 5, dtype=np.uint16)
+    palette[:, 2:6] = np.where(eightAlphas, palette[:, 2:6], ((5 - fourSteps) * a0 + fourSteps * a1) // 5)
+    palette[:, 7] = np.where(eightAlphas[:, 0], palette[:, 7], 255)
+
+    # 16 3-bit indices in a 48-bit little-endian value
+    alphaBytes = blocks['alphaBits'].astype(np.uint64)
+    alphaBits = np.zeros(count, dtype=np.uint64)
+    for i in range(6):
+        alphaBits |= alphaBytes[:, i] << np.uint64(8 * i)
+    indices = (alphaBits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & 0x7
+    pixels[:, :, 3] = palette[np.arange(count)[:, None], indices.astype(np.intp)]
+    return _unblock(pixels, width, height)
+
+def decodeAlphaMask(data, width: int, height: int):
+    """Decode an 0xA9FF (8-bit alpha) image as an opaque grey RGBA array."""
+    alpha = np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width)
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    image[:, :, :3] = alpha[:, :, None]
+    image[:, :, 3] = 255
+    return image
+
+def decodeBGRA(data, width: int, height: int):
+    """Decode an 0xAA1B (swizzled BGRA8) image to a height x width x 4 RGBA array."""
+    linear = rtt2dds.deswizzleAndFlipSlice(data, width, height)
+    return np.frombuffer(linear, dtype=np.uint8).reshape(height, width, 4)[:, :, [2, 1, 0, 3]]
+
+DECODERS = {b'DXT1': decodeBC1, b'DXT3': decodeBC2, b'DXT5': decodeBC3,
+            0xA9FF: decodeAlphaMask, 0xAA1B: decodeBGRA}
+
+def _decoder(dds_header, img_fmt: int):
+    if dds_header.fourCC in DECODERS:
+        return DECODERS[dds_header.fourCC]
+    if img_fmt in DECODERS:
+        return DECODERS[img_fmt]
+    raise ValueError("Can't decode image format " + hex(img_fmt))
+
+def mipLevels(data):
+    """Validate the .rtt and return (dds_header, img_fmt, levels), where levels
+    holds the ffutils.MipLevel of each mip level.
+    """
+    dds_header, img_fmt, depth = rtt2dds.parseRttHeader(data)
+    levels = rtt2dds.mipLayout(dds_header, depth)
+    if not levels:
+        raise ValueError("Texture has no mip levels")
+    return dds_header, img_fmt, levels
+
+def decodeMip(data, mip: int=0, depthSlice: int=0):
+    """Decode one slice of one mip level of an .rtt to a height x width x 4 RGBA array.
+
+    Only the bytes of that slice are read from data, which can be any buffer
+    (eg. a memory-mapped file).
+    """
+    dds_header, img_fmt, levels = mipLevels(data)
+    return _decodeLevel(data, _decoder(dds_header, img_fmt), levels[mip], depthSlice)
+
+def _decodeLevel(data, decode, level: ffutils.MipLevel, depthSlice: int=0):
+    start = 0x80 + level.slice_offset(min(depthSlice, level.depth - 1))
+    if start + level.slice_size > len(data):
+        raise ValueError("Mip level extends past the end of the file")
+    # A copy of just this slice, so no view of the (possibly mapped) file outlives the call
+    return decode(bytes(data[start:start+level.slice_size]), level.width, level.height)
+
+def _resize(image, width: int, height: int):
+    """Nearest-neighbour resize of an RGBA array"""
+    rows = np.arange(height) * image.shape[0] // height
+    columns = np.arange(width) * image.shape[1] // width
+    return image[rows[:, None], columns]
+
+def thumbnail(data, size: int):
+    """An RGBA thumbnail of the .rtt that fits in size x size pixels.
+
+    Only the smallest mip level that is at least size pixels across is
+    decoded, and is then scaled down to fit.
+    """
+    dds_header, img_fmt, levels = mipLevels(data)
+    level = levels[0]
+    for candidate in levels:
+        if max(candidate.width, candidate.height) >= size:
+            level = candidate
+    with instrument.stage("rtt: decode", level.size):
+        image = _decodeLevel(data, _decoder(dds_header, img_fmt), level)
+    height, width = image.shape[:2]
+    if max(width, height) > size:
+        scale = size / max(width, height)
+        with instrument.stage("image: resize"):
+            image = _resize(image, max(1, round(width * scale)), max(1, round(height * scale)))
+    return image
+
+def loadThumbnail(filepath: str, size: int):
+    """thumbnail() of an .rtt file, which is memory-mapped so only the mip level used is read.
+    Files in a .psarc are read whole.
+    """
+    if psarc.isArchivePath(filepath):
+        return thumbnail(psarc.readFile(filepath), size)
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 0x80:
+            return thumbnail(f.read(), size)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return thumbnail(mm, size)
+
+def contactSheet(images: list, size: int, columns: int):
+    """Lay the images (each at most size x size) out in a grid, centred in their cells."""
+    rows = max(1, (len(images) + columns - 1) // columns)
+    sheet = np.zeros((rows * size, min(columns, max(1, len(images))) * size, 4), dtype=np.uint8)
+    for i, image in enumerate(images):
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        top = (i // columns) * size + (size - height) // 2
+        left = (i % columns) * size + (size - width) // 2
+        sheet[top:top+height, left:left+width] = image
+    return sheet
+
+def _pngChunk(chunk_type: bytes, payload: bytes):
+    return (struct.pack(">I", len(payload)) + chunk_type + payload +
+            struct.pack(">I", zlib.crc32(chunk_type + payload) & 0xFFFFFFFF))
+
+def writePng(path: str, image):
+    """Write an RGBA array as an 8-bit RGBA .png"""
+    height, width = image.shape[:2]
+    # Every row starts with filter type 0 (none)
+    rows = np.zeros((height, 1 + width * 4), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 4)
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_pngChunk(b'IHDR', ihdr))
+        f.write(_pngChunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(_pngChunk(b'IEND', b''))
+
+def writePpm(path: str, image, background: int=0x80):
+    """Write an RGBA array as a binary .ppm, blended over a grey background"""
+    height, width = image.shape[:2]
+    alpha = image[:, :, 3:].astype(np.uint16)
+    rgb = (image[:, :, :3] * alpha + background * (255 - alpha)) // 255
+    with open(path, 'wb') as f:
+        f.write("P6\n{} {}\n255\n".format(width, height).encode('ascii'))
+        f.write(rgb.astype(np.uint8).tobytes())
+
+WRITERS = {'.png': writePng, '.ppm': writePpm}
+
+def writeImage(path: str, image):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError("Unknown image format (expecting .png or .ppm): " + path)
+    with instrument.stage("image: write"):
+        WRITERS[extension](path, image)
+
+def _thumbnail_job(job: tuple):
+    """Returns (thumbnail or None, error message or None)"""
+    filepath, size = job
+    try:
+        return loadThumbnail(filepath, size), None
+    except (OSError, ValueError, struct.error) as err:
+        return None, "{}: {}".format(type(err).__name__, err)
+
+def _sheetPaths(path: str, count: int):
+    if count == 1:
+        return [path]
+    stem, extension = os.path.splitext(path)
+    return ["{}_{:03d}{}".format(stem, i, extension) for i in range(count)]
+
+def _writeSheets(path: str, files: list, thumbnails: list, size: int, columns: int, per_sheet: int):
+    """Write the contact sheets, and a .txt next to each listing its files in order."""
+    chunks = [range(i, min(i + per_sheet, len(files))) for i in range(0, len(files), per_sheet)]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    for sheet_path, chunk in zip(_sheetPaths(path, len(chunks)), chunks):
+        writeImage(sheet_path, contactSheet([thumbnails[i] for i in chunk], size, columns))
+        with open(os.path.splitext(sheet_path)[0] + '.txt', 'w') as f:
+            for i in chunk:
+                f.write("{}\t{}\t{}\n".format(i % per_sheet // columns, i % per_sheet % columns, files[i]))
+        print("Wrote " + sheet_path)
+
+def _previewPath(filepath: str, relpath: str, outdir: str, extension: str):
+    out_filename = os.path.splitext(os.path.basename(filepath))[0] + extension
+    if outdir is None and psarc.isArchivePath(filepath):
+        outdir = '.' # Mirror the archive in the current directory
+    if outdir is None:
+        return os.path.join(os.path.dirname(filepath), out_filename)
+    return os.path.join(outdir, os.path.dirname(relpath), out_filename)
+
+def _run(args):
+    files = list(psarc.findFiles(args.filepath, '.rtt'))
+    jobs = [(filepath, args.size) for filepath, relpath in files]
+    if args.jobs is not None and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+            results = list(map(instrument.unwrap, executor.map(instrument.wrap(_thumbnail_job), jobs,
+                                                               chunksize=max(1, len(jobs) // (args.jobs * 4)))))
+    else:
+        results = list(map(instrument.timed(_thumbnail_job), jobs))
+
+    failures = []
+    for (filepath, relpath), (image, err) in zip(files, results):
+        if err is not None:
+            failures.append((filepath, err))
+        elif args.sheet is None:
+            out_path = _previewPath(filepath, relpath, args.outdir, '.' + args.format)
+            os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+            writeImage(out_path, image)
+    if args.sheet is not None:
+        per_sheet = max(args.columns, args.per_sheet - args.per_sheet % args.columns)
+        _writeSheets(args.sheet, [filepath for filepath, relpath in files],
+                     [image for image, err in results], args.size, args.columns, per_sheet)
+
+    print("Decoded {} of {} files".format(len(files) - len(failures), len(files)))
+    batch.printFailures(failures, byMessage=True)
+
+def main(argv: list=None, prog: str=None):
+    parser = argparse.ArgumentParser(
+            prog=prog, description="Decode .rtt files to thumbnails or contact sheets")
+    parser.add_argument("--size", type=int, default=128, help="size of the thumbnails in pixels (default: 128)")
+    parser.add_argument("--sheet", help="write contact sheets of all the thumbnails to this .png or .ppm instead of a preview per file")
+    parser.add_argument("--columns", type=int, default=16, help="thumbnails per row of a contact sheet (default: 16)")
+    parser.add_argument("--per-sheet", type=int, default=256, help="thumbnails per contact sheet, further sheets are numbered (default: 256)")
+    parser.add_argument("--format", choices=sorted(ext[1:] for ext in WRITERS), default='png', help="format of the previews per file (default: png)")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes to decode with")
+    parser.add_argument("-o", "--outdir", help="write the previews per file here (mirroring the input directories) instead of next to the .rtt files")
+    parser.add_argument("filepath", nargs="+", help="path to .rtt file or directory of .rtt files")
+    instrument.addArguments(parser)
+    args = parser.parse_args(argv)
+    if np is None:
+        sys.exit("rtt_preview.py needs NumPy (pip install numpy)")
+    with instrument.session(args):
+        _run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import pytest
+
+from warhawk import psarc
+
+def test_corrupt_block_is_a_value_error(tmp_path):
+    path = str(tmp_path / "bad.psarc")
+    # Compressible, so the block is stored compressed
+    psarc.createArchive(path, {"textures/a.rtt": bytes(0x1000)})
+    data = bytearray(open(path, 'rb').read())
+    data[-3] ^= 0xff
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    with pytest.raises(ValueError, match="corrupt block"):
+        psarc.readFile(path + ":textures/a.rtt")
+
+@pytest.mark.parametrize("name", ["../../x", "a/../../x", ".."])
+def test_output_path_rejects_names_outside_the_outdir(name):
+    with pytest.raises(ValueError):
+        psarc.outputPath(name)
+
+def test_output_path_normalises_names():
+    assert psarc.outputPath("/textures/./a/../b.rtt") == "textures/b.rtt"
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+# The warhawk package is imported from src/, so the benchmark runs without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from warhawk import psarc
+from warhawk import rtt2dds
+from warhawk import ngp_models
+from warhawk import extract_loc
+from warhawk import ngp_textures
+import fixtures
+
+RESULTS_VERSION = 1
+
+def _files(workdir: str, pattern: str):
+    return sorted(glob.glob(os.path.join(workdir, "fixtures", pattern)))
+
+def _sizes(paths: list):
+    return sum(os.path.getsize(path) for path in paths), len(paths)
+
+# Each case converts (or decodes) the fixtures in workdir and returns (bytes read, files read)
+
+def benchRtt2dds(workdir: str):
+    """rtt2dds.convertFile() on every .rtt"""
+    paths = _files(workdir, "textures/*.rtt")
+    for path in paths:
+        rtt2dds.convertFile(path, os.path.join(workdir, "out", os.path.basename(path)[:-4] + ".dds"))
+    return _sizes(paths)
+
+def benchDeswizzle(workdir: str):
+    """rtt2dds._deswizzle_and_flip() on the BGRA8 .rtt files, in memory"""
+    paths = _files(workdir, "textures/bgra_*.rtt")
+    size = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        dds_header, img_fmt, depth = rtt2dds.parseRttHeader(data)
+        rtt2dds._deswizzle_and_flip(memoryview(data)[0x80:], dds_header.width, dds_header.height,
+                                    dds_header.num_mipmaps, depth)
+        size += len(data)
+    return size, len(paths)
+
+def benchFindModels(workdir: str):
+    """ngp_models.findModelHeaders() searching every .ngp (as findNextModel does)"""
+    paths = _files(workdir, "maps/*.ngp")
+    for path in paths:
+        with open(path, 'rb') as f:
+            ngp_models.findModelHeaders(f.read())
+    return _sizes(paths)
+
+def benchNgpModels(workdir: str):
+    """ngp_models.extractModels() to .obj on every .ngp"""
+    paths = _files(workdir, "maps/*.ngp")
+    for path in paths:
+        ngp_models.extractModels(path)
+    return _sizes(paths + [path[:-4] + ".vram" for path in paths])
+
+def benchNgpTextures(workdir: str):
+    """ngp_textures.extractTextures() to .dds on every .ngp"""
+    paths = _files(workdir, "maps/*.ngp")
+    for path in paths:
+        ngp_textures.extractTextures(path, os.path.join(workdir, "out", os.path.basename(path)[:-4]),
+                                     asDds=True, verbose=False)
+    return _sizes(paths + [path[:-4] + ".vram" for path in paths])
+
+def benchExtractLoc(workdir: str):
+    """extract_loc.convertFile() on every .loc"""
+    paths = _files(workdir, "loc/*.loc")
+    for path in paths:
+        extract_loc.convertFile(path)
+    return _sizes(paths)
+
+def benchPsarc(workdir: str):
+    """Reading every file out of the .psarc"""
+    size = 0
+    with psarc.PsarcArchive(os.path.join(workdir, "fixtures.psarc")) as archive:
+        names = archive.names()
+        for name in names:
+            size += len(archive.read(name))
+    return size, len(names)
+
+CASES = {
+    "rtt2dds": benchRtt2dds,
+    "deswizzle": benchDeswizzle,
+    "find_models": benchFindModels,
+    "ngp_models": benchNgpModels,
+    "ngp_textures": benchNgpTextures,
+    "extract_loc": benchExtractLoc,
+    "psarc": benchPsarc,
+}
+
+def _call(case, workdir: str):
+    # The tools print progress, which would only be measuring the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        return case(workdir)
+
+def measure(case, workdir: str, repeat: int=3):
+    """Time a case (the best of repeat runs), then run it again under
+    tracemalloc for its peak memory use.
+    """
+    seconds = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        size, files = _call(case, workdir)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    # Kept separate from the timing, as tracing every allocation slows everything down
+    tracemalloc.start()
+    try:
+        _call(case, workdir)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "bytes": size,
+        "files": files,
+        "mib_per_s": size / (1024 * 1024) / seconds if seconds else 0.0,
+        "files_per_s": files / seconds if seconds else 0.0,
+        "peak_memory": peak,
+    }
+
+def _environment():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "numpy": numpy_version}
+
+def run(names: list, settings: dict, workdir: str, repeat: int=3):
+    """Generate the fixtures in workdir and measure each of the named cases.
+
+    settings are the arguments to fixtures.makeFixtures(). Returns the results,
+    as saved with --output.
+    """
+    files = fixtures.makeFixtures(**settings)
+    fixtures.writeFixtures(os.path.join(workdir, "fixtures"), files, os.path.join(workdir, "fixtures.psarc"))
+    os.makedirs(os.path.join(workdir, "out"), exist_ok=True)
+    results = {"version": RESULTS_VERSION, "environment": _environment(), "fixtures": settings, "cases": {}}
+    for name in names:
+        results["cases"][name] = measure(CASES[name], workdir, repeat)
+    return results
+
+def compare(baseline: dict, results: dict, threshold: float):
+    """Lines comparing results against baseline, and whether any case got more
+    than threshold percent slower or used more than threshold percent more memory.
+    """
+    lines = []
+    regressed = False
+    if baseline.get("fixtures") != results["fixtures"]:
+        lines.append("Warning: the baseline was run with different fixtures: {}".format(baseline.get("fixtures")))
+    for name, result in results["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            lines.append("{:<14} (not in the baseline)".format(name))
+            continue
+        speed = (result["mib_per_s"] / old["mib_per_s"] - 1) * 100 if old["mib_per_s"] else 0.0
+        memory = (result["peak_memory"] / old["peak_memory"] - 1) * 100 if old["peak_memory"] else 0.0
+        flags = []
+        if speed < -threshold:
+            flags.append("SLOWER")
+        if memory > threshold:
+            flags.append("MORE MEMORY")
+        regressed = regressed or bool(flags)
+        lines.append("{:<14} {:>9.1f} -> {:>9.1f} MiB/s ({:+6.1f}%)  {:>8.1f} -> {:>8.1f} MiB peak ({:+6.1f}%)  {}".format(
+            name, old["mib_per_s"], result["mib_per_s"], speed,
+            old["peak_memory"] / (1024 * 1024), result["peak_memory"] / (1024 * 1024), memory, " ".join(flags)))
+    return lines, regressed
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Measure the throughput and peak memory of the tools on synthetic files (see fixtures.py)")
+    parser.add_argument("cases", nargs="*", metavar="case",
+                        help="cases to run (default: all of {})".format(", ".join(CASES)))
+    parser.add_argument("--count", type=int, default=2, help="number of copies of each fixture (default: 2)")
+    parser.add_argument("--texture-size", type=int, default=512, help="width of the .rtt fixtures (default: 512)")
+    parser.add_argument("--repeat", type=int, default=3, help="time each case this many times and keep the best (default: 3)")
+    parser.add_argument("--workdir", help="directory to generate the fixtures and outputs in (default: a temporary directory)")
+    parser.add_argument("-o", "--output", help="save the results as JSON, to compare later runs against")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with results saved by an earlier run")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent slower or more memory counted as a regression by --compare (default: 10)")
+    args = parser.parse_args()
+    for name in args.cases:
+        if name not in CASES:
+            parser.error("unknown case {} (choose from {})".format(name, ", ".join(CASES)))
+
+    settings = {"count": args.count, "textureSize": args.texture_size, "seed": 0}
+    names = args.cases or list(CASES)
+    if args.workdir is not None:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run(names, settings, args.workdir, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            results = run(names, settings, workdir, args.repeat)
+
+    for name, result in results["cases"].items():
+        print("{:<14} {:>9.1f} MiB/s {:>9.1f} files/s {:>8.1f} MiB peak  ({} files, {:.1f} MiB in {:.3f}s)".format(
+            name, result["mib_per_s"], result["files_per_s"], result["peak_memory"] / (1024 * 1024),
+            result["files"], result["bytes"] / (1024 * 1024), result["seconds"]))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(baseline, results, args.threshold)
+        print()
+        print("Compared with " + args.compare + ":")
+        for line in lines:
+            print(line)
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import struct
+import random
+import argparse
+
+# The warhawk package is imported from src/, so the fixtures can be made without installing it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from warhawk import psarc
+from warhawk import ffutils
+
+# (compression method, image format) of each kind of texture in docs/RTT.md
+RTT_FORMATS = {
+    "mask": (0x01, 0xA9FF),
+    "bgra": (0x05, 0xAA1B),
+    "dxt1": (0x06, 0xAAE4),
+    "dxt3": (0x07, 0xAAE4),
+    "dxt5": (0x08, 0xAAE4),
+}
+
+NGP_MAGIC = bytes.fromhex("696570334616A42B")
+
+def _randomBytes(rnd: random.Random, size: int):
+    # Same bytes as rnd.randbytes(size), which needs Python 3.9
+    return rnd.getrandbits(8 * size).to_bytes(size, 'little') if size else b''
+
+def textureLayout(compression: int, img_fmt: int, width: int, height: int, num_mipmaps: int, depth: int=1):
+    fourCC = ffutils.COMPRESSION_FOURCCS[compression]
+    return ffutils.get_mip_layout(width, height, num_mipmaps, fourCC, ffutils.FORMAT_BITS.get(img_fmt, 0), depth)
+
+def makeRtt(compression: int, img_fmt: int, width: int, height: int, num_mipmaps: int=1, depth: int=1, rnd: random.Random=None):
+    """A valid .rtt of random texture data. A depth above 1 makes a volume texture."""
+    rnd = rnd or random.Random(0)
+    dimensions = 0x3 if depth > 1 else 0x2
+    payload = _randomBytes(rnd, ffutils.get_layout_size(textureLayout(compression, img_fmt, width, height, num_mipmaps, depth)))
+    header = (struct.pack(">I", 0x80000000 | (0x80 + len(payload) - 4)) +
+              struct.pack(">BBHHHBBBB", compression, 0x0, img_fmt, width, height, 0x0, depth, num_mipmaps, dimensions))
+    return header + bytes(0x70) + payload
+
+def rttVariants(size: int=256):
+    """Yield (name, makeRtt() arguments) for every format, with and without
+    mipmaps, square and 2:1, and as a volume texture.
+    """
+    for name, (compression, img_fmt) in RTT_FORMATS.items():
+        for width, height in ((size, size), (size, size // 2)):
+            for num_mipmaps in (1, width.bit_length()):
+                yield ("{}_{}x{}_{}mip".format(name, width, height, num_mipmaps),
+                       (compression, img_fmt, width, height, num_mipmaps))
+        # Volume textures are 16 slices deep in the game files
+        volume = max(4, size // 16)
+        yield ("{}_{}x{}x16_vol".format(name, volume, volume),
+               (compression, img_fmt, volume, volume, volume.bit_length(), 16))
+
+class _Builder:
+    '''A file being built up, with helpers for its pointers'''
+    def __init__(self):
+        self.data = bytearray()
+
+    def put(self, data: bytes):
+        """Append data, returning where it was put"""
+        offset = len(self.data)
+        self.data += data
+        return offset
+
+    def align(self, alignment: int=0x10):
+        self.data += bytes(-len(self.data) % alignment)
+
+    def setPointer(self, locOfPointer: int, offset: int):
+        """Make the relative pointer at locOfPointer point to offset"""
+        struct.pack_into(">i", self.data, locOfPointer, offset - locOfPointer)
+
+    def setOffset(self, loc: int, offset: int):
+        struct.pack_into(">I", self.data, loc, offset)
+
+def _triangles(numberOfVertices: int, flip_winding: bool):
+    """Faces (indexed from 0) of a strip using every vertex"""
+    return b''.join(struct.pack(">HHH", i, i + 2, i + 1) if flip_winding else struct.pack(">HHH", i, i + 1, i + 2)
+                    for i in range(numberOfVertices - 2))
+
+def _halfFloats(rnd: random.Random, count: int, padding: int):
+    return b''.join(struct.pack(">ee", rnd.random(), rnd.random()) + bytes(padding) for i in range(count))
+
+def _putModelType1(ngp: _Builder, vram: _Builder, textureLink: int, numberOfVertices: int, rnd: random.Random):
+    """A static mesh: scaled short vertices, with the UVs in the .vram"""
+    numberOfFaces = numberOfVertices - 2
+    header = ngp.put(bytes(0x2C + 5 * 0x0C))
+    ngp.data[header:header+0x38] = struct.pack(">IiffffIIIHBBIIII", 1, 0,
+        rnd.uniform(1.0, 500.0), rnd.uniform(1.0, 500.0), rnd.uniform(1.0, 500.0), 0.0078125,
+        4, numberOfFaces * 3, numberOfVertices, numberOfVertices, 5, 1, 0, 5, 0x06030100, 0)
+    ngp.setPointer(header + 0x04, textureLink)
+    faces = ngp.put(_triangles(numberOfVertices, False))
+    ngp.align()
+    vertices = ngp.put(b''.join(struct.pack(">hhh", rnd.randint(-0x8000, 0x7FFF), rnd.randint(-0x8000, 0x7FFF),
+                                            rnd.randint(-0x8000, 0x7FFF)) for i in range(numberOfVertices)))
+    ngp.align()
+    ngp.setOffset(header + 0x28, faces)
+    ngp.setOffset(header + 0x34, vertices)
+    uvs = vram.put(_halfFloats(rnd, numberOfVertices, 0x0C))
+    vram.align()
+    linkers = [(0x00020004, 0x10, 0x0, 0x0), (0x00080003, 0x10, 0x0, uvs),
+               (0x000A0004, 0x10, 0x0, 0x0), (0x00090003, 0x10, 0x0, 0x0)]
+    for i, (ident, stride, isInNGP, offset) in enumerate(linkers):
+        struct.pack_into(">IBBBBI", ngp.data, header + 0x38 + i * 0x0C, ident, stride, 0x3, isInNGP, 0x0, offset)
+    return header
+
+def _putModelType2(ngp: _Builder, textureLink: int, numberOfVertices: int, rnd: random.Random):
+    """A rigged mesh: float vertices (with packed normals), with the UVs in the .ngp"""
+    header = ngp.put(bytes(0x48 + 3 * 0x0C))
+    ngp.put(bytes(0x0C)) # Ends the linkers
+    struct.pack_into(">I", ngp.data, header, 2)
+    struct.pack_into(">f", ngp.data, header + 0x14, 1.0)
+    ngp.setPointer(header + 0x04, textureLink)
+    ngp.align()
+    # The face data has to run up to the vertex data
+    faces = ngp.put(_triangles(numberOfVertices, True))
+    vertices = ngp.put(b''.join(struct.pack(">fff", rnd.uniform(-5.0, 5.0), rnd.uniform(-5.0, 5.0),
+                                            rnd.uniform(-5.0, 5.0)) + bytes(8) for i in range(numberOfVertices)))
+    ngp.align()
+    ngp.setPointer(header + 0x24, vertices)
+    ngp.setOffset(header + 0x44, faces)
+    uvs = ngp.put(_halfFloats(rnd, numberOfVertices, 0x4))
+    ngp.align()
+    linkers = [(0x00020004, 0x14, 0x1, 0x0), (0x00080003, 0x08, 0x1, uvs), (0x00030003, 0x08, 0x1, 0x0)]
+    for i, (ident, stride, isInNGP, offset) in enumerate(linkers):
+        struct.pack_into(">IBBBBI", ngp.data, header + 0x48 + i * 0x0C, ident, stride, 0x3, isInNGP, 0x0, offset)
+    return header
+
+def makeNgp(numberOfModels: int=4, numberOfVertices: int=100, numberOfTextures: int=2, textureSize: int=64,
+            rnd: random.Random=None, listedModels: int=None):
+    """A valid .ngp and .vram, returned as (ngp data, vram data).
+
+    The models alternate between Type 1 and Type 2 headers, each linked to one
+    of the textures, and Table 3 lists the first listedModels of them (default:
+    all). The textures cycle through the formats in RTT_FORMATS, with their
+    data alternately in the .vram and .ngp.
+    """
+    if listedModels is None:
+        listedModels = numberOfModels
+    rnd = rnd or random.Random(0)
+    ngp = _Builder()
+    vram = _Builder()
+    ngp.put(NGP_MAGIC + struct.pack(">I", rnd.getrandbits(32)) + bytes(0x14))
+
+    ngp.setPointer(0x0C, ngp.put(struct.pack(">I", 0))) # Table 1, empty
+    ngp.align()
+    table2 = ngp.put(struct.pack(">I", numberOfTextures) + bytes(4 * numberOfTextures))
+    ngp.align()
+    ngp.setPointer(0x10, table2)
+    table3 = ngp.put(struct.pack(">HHi", 0, listedModels, 0) + bytes(4 * numberOfModels))
+    ngp.align()
+    ngp.setPointer(0x14, table3)
+    ngp.setPointer(table3 + 0x04, table3) # Empty T3.0 table
+    ngp.setPointer(0x18, ngp.put(bytes(4))) # Data 4
+    ngp.setPointer(0x1C, ngp.put(bytes(4))) # Data 5
+    ngp.align()
+
+    textures = []
+    formats = list(RTT_FORMATS.values())
+    for i in range(numberOfTextures):
+        compression, img_fmt = formats[i % len(formats)]
+        isInNGP = i % 2
+        num_mipmaps = textureSize.bit_length()
+        header = ngp.put(struct.pack(">BBHHHBBBBI", compression, 0x0, img_fmt, textureSize, textureSize,
+                                     isInNGP, 1, num_mipmaps, 0x2, 0))
+        ngp.setPointer(table2 + 4 + 4 * i, header)
+        size = ffutils.get_layout_size(textureLayout(compression, img_fmt, textureSize, textureSize, num_mipmaps))
+        textures.append((header, isInNGP, size))
+    ngp.align()
+
+    for i in range(numberOfModels):
+        # The data linking the model to its texture
+        textureHeader = textures[i % numberOfTextures][0] if textures else 0
+        link = ngp.put(struct.pack(">Ii", 0x00111122, 0) + bytes(8))
+        if textures:
+            ngp.setPointer(link + 0x04, textureHeader)
+        textureLink = ngp.put(bytes(0x20))
+        ngp.setPointer(textureLink + 0x10, link)
+        ngp.align()
+        if i % 2 == 0:
+            header = _putModelType1(ngp, vram, textureLink, numberOfVertices, rnd)
+        else:
+            header = _putModelType2(ngp, textureLink, numberOfVertices, rnd)
+        if i < listedModels:
+            ngp.setPointer(table3 + 0x08 + 4 * i, header)
+
+    for header, isInNGP, size in textures:
+        data = ngp if isInNGP else vram
+        data.align(0x80)
+        ngp.setOffset(header + 0x0C, data.put(_randomBytes(rnd, size)))
+    ngp.align()
+    return bytes(ngp.data), bytes(vram.data)
+
+_LOC_CHARACTERS = "abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ 0123456789.,!?'\"\\\néüß€中文"
+
+def makeLoc(numberOfCategories: int=10, numberOfEntries: int=500, rnd: random.Random=None):
+    """A valid .loc of random UTF-16 strings"""
+    rnd = rnd or random.Random(0)
+    header = bytearray(struct.pack(">I", numberOfCategories) + bytes(0x0C * numberOfCategories))
+    categories = bytearray()
+    strings = bytearray()
+    categoryPointers = []
+    stringPointers = []
+    for i in range(numberOfCategories):
+        name = "cat{}".format(i).encode('latin-1')
+        header[0x4+0x0C*i:0x4+0x0C*i+len(name)] = name
+        categoryPointers.append((0x4 + 0x0C * i + 0x8, len(header) + len(categories)))
+        categories += struct.pack(">I", numberOfEntries)
+        for entry_id in rnd.sample(range(1 << 32), numberOfEntries):
+            text = "".join(rnd.choice(_LOC_CHARACTERS) for j in range(rnd.randrange(40)))
+            stringPointers.append((len(header) + len(categories) + 4, len(strings)))
+            categories += struct.pack(">Ii", entry_id, 0)
+            strings += text.encode('utf-16-be') + b'\x00\x00'
+    data = header + categories
+    stringsOffset = len(data)
+    data += strings
+    for locOfPointer, offset in categoryPointers:
+        struct.pack_into(">i", data, locOfPointer, offset - locOfPointer)
+    for locOfPointer, offset in stringPointers:
+        struct.pack_into(">i", data, locOfPointer, stringsOffset + offset - locOfPointer)
+    return bytes(data)
+
+def makeFixtures(count: int=1, textureSize: int=256, models: int=50, vertices: int=1000, textures: int=8,
+                 categories: int=20, entries: int=1000, seed: int=0):
+    """{path: data} of a synthetic dump: every .rtt variant, .ngp/.vram pairs and
+    .loc files, count of each. The same seed always gives the same files.
+    Every other .ngp lists only half its models in Table 3, so both ways of
+    finding the models are exercised.
+    """
+    rnd = random.Random(seed)
+    files = {}
+    for n in range(count):
+        for name, arguments in rttVariants(textureSize):
+            files["textures/{}_{}.rtt".format(name, n)] = makeRtt(*arguments, rnd=rnd)
+        ngp, vram = makeNgp(models, vertices, textures, max(4, textureSize // 2), rnd,
+                            models // 2 if n % 2 else None)
+        files["maps/map_{}.ngp".format(n)] = ngp
+        files["maps/map_{}.vram".format(n)] = vram
+        files["loc/language_{}.loc".format(n)] = makeLoc(categories, entries, rnd)
+    return files
+
+def writeFixtures(outdir: str, files: dict, archive: str=None):
+    """Write the files under outdir (and into a .psarc if archive is given), returning the paths written"""
+    outputs = []
+    for name, data in sorted(files.items()):
+        path = os.path.join(outdir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        outputs.append(path)
+    if archive is not None:
+        psarc.createArchive(archive, files)
+        outputs.append(archive)
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Generate synthetic .rtt, .ngp/.vram and .loc files for testing and benchmarking")
+    parser.add_argument("-o", "--outdir", required=True, help="directory to write the files to")
+    parser.add_argument("--count", type=int, default=1, help="number of copies of each file (default: 1)")
+    parser.add_argument("--texture-size", type=int, default=256, help="width of the .rtt textures, a power of 2 (default: 256)")
+    parser.add_argument("--models", type=int, default=50, help="models in each .ngp (default: 50)")
+    parser.add_argument("--vertices", type=int, default=1000, help="vertices in each model (default: 1000)")
+    parser.add_argument("--textures", type=int, default=8, help="textures in each .ngp (default: 8)")
+    parser.add_argument("--categories", type=int, default=20, help="categories in each .loc (default: 20)")
+    parser.add_argument("--entries", type=int, default=1000, help="strings in each .loc category (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random data (default: 0)")
+    parser.add_argument("--psarc", metavar="PATH", help="also pack the files into a .psarc")
+    args = parser.parse_args()
+
+    files = makeFixtures(args.count, args.texture_size, args.models, args.vertices, args.textures,
+                         args.categories, args.entries, args.seed)
+    outputs = writeFixtures(args.outdir, files, args.psarc)
+    print("Wrote {} files ({:.1f} MiB)".format(len(outputs), sum(len(data) for data in files.values()) / (1024 * 1024)))
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,12 @@
 #!/usr/bin/env python3
 
-import argparse
-import struct
+import os
+import sys
 
-def dereferenceRelativePointer(data: bytearray, locOfPointer: int):
-    relativeOffset = struct.unpack(">i", data[locOfPointer:locOfPointer+4])[0]
-    offset = locOfPointer + relativeOffset
-    return offset
+# Kept here next to the other reversing scripts, the tool itself is in the warhawk package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
 
-def main():
-    parser = argparse.ArgumentParser(
-            description="Find the address that a relative pointer points to")
-    parser.add_argument("filepath", help="path to the file")
-    parser.add_argument("offset", help="offset of the pointer in hex (eg 0x1c)")
-    args = parser.parse_args()
-    with open(args.filepath, 'rb') as f:
-        data = bytearray(f.read())
-    print(hex(dereferenceRelativePointer(data, int(args.offset, 16))))
+from warhawk.follow_ptr import main
 
-if __name__ == "__main__":
+if __name__ == '__main__':
     main()